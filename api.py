@@ -1,57 +1,265 @@
 import os
-import json
+import atexit
 import asyncio
+import hashlib
+import re
+import importlib
+import threading
 import traceback
-from collections import deque
-from typing import Optional, List, Dict, Any
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Header
-from fastapi.responses import StreamingResponse, JSONResponse
+import uuid
+import sys
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Tuple
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Header, BackgroundTasks
+from fastapi.responses import Response, StreamingResponse, JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from gradio import ChatMessage  # for consistent history objects
 from medrax.utils.jwt import verify_jwt
 import time
 from pathlib import Path
+from cachetools import TTLCache
+import aiofiles
+import anyio
+import orjson
+import httpx
+from dotenv import load_dotenv
+
+# Load .env before any module-level configuration below is read
+load_dotenv()
+
+try:
+    # Adds keep-alive pings so proxies don't drop long agent runs; plain StreamingResponse otherwise
+    from sse_starlette.sse import EventSourceResponse
+except ImportError:
+    EventSourceResponse = None
+
+try:
+    import pydicom  # type: ignore
+except ImportError:  # optional: only needed to sniff DICOM modality
+    pydicom = None
+
+
+class _LazyModule:
+    """Module proxy that defers the real import until first attribute access.
+
+    `main` and `interface` transitively import torch/transformers/gradio, so they
+    are only loaded once MedRAX initialization actually needs them.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+_main = _LazyModule("main")
+_interface = _LazyModule("interface")
+
+# Set once the startup warmup thread has finished importing the heavy ML modules
+_PRELOAD_DONE = threading.Event()
+_PRELOAD_TIMEOUT = float(os.getenv("PRELOAD_TIMEOUT", "300"))
+_preload_started = False
+
+
+def _preload_ml_modules() -> None:
+    """Import `main`/`interface` (and with them torch/transformers) off the event loop."""
+    try:
+        for name in ("main", "interface"):
+            importlib.import_module(name)
+    except Exception as e:
+        # initialize_medrax re-imports and reports the failure properly
+        _log("WARN", f"Background module preload failed: {e}")
+    finally:
+        _PRELOAD_DONE.set()
+
 
 # Globals
-initialization_error: Optional[str] = None
-initialization_error_msg: Optional[str] = None
-initialization_error_tb: Optional[str] = None
+# Compact {"msg", "type"} of the last init failure; the full traceback goes to _INIT_ERROR_LOG
+initialization_error: Optional[Dict[str, str]] = None
 agent = None
 tools_dict = None
 chat_interface = None
-chat_sessions: Dict[str, Dict] = {}
+# In-memory chat sessions keyed by thread id; bounded and idle-expiring so long uptimes don't leak
+chat_sessions: TTLCache = TTLCache(
+    maxsize=int(os.getenv("MAX_SESSIONS", "10000")),
+    ttl=int(os.getenv("SESSION_TTL", "3600")),
+)
+# Background /upload post-processing state keyed by saved filename
+upload_status: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+# Set when an upload's post-processing settles; chats referencing it wait on these
+_upload_events: Dict[str, asyncio.Event] = {}
+# Upper bound (s) a chat waits for its image's post-processing before proceeding anyway
+UPLOAD_WAIT_TIMEOUT = float(os.getenv("UPLOAD_WAIT_TIMEOUT", "120"))
+
+# Init runs once; concurrent callers wait on the event instead of queueing on a lock
+_init_started = False
+_init_done = asyncio.Event()
+
+# Tools and model choices — keep aligned with main.initialize_agent
+_SELECTED_TOOLS = (
+    "ImageVisualizerTool",
+    "DicomProcessorTool",
+    "ChestXRayClassifierTool",
+    "ChestXRaySegmentationTool",
+    "ChestXRayReportGeneratorTool",
+    "XRayVQATool",
+    "LlavaMedTool",
+    "XRayPhraseGroundingTool",
+)
+# Function-calling models, tried in order until one initializes
+_FUNCTION_CALLING_MODELS = (
+    "qwen2.5:7b",
+    "mistral:latest",
+)
+
+# Admission control: cap concurrent agent streams so overload degrades into 429s, not global slowdown
+MAX_CONCURRENT_CHATS = int(os.getenv("MAX_CONCURRENT_CHATS", "4"))
+_chat_sem = asyncio.Semaphore(MAX_CONCURRENT_CHATS)
+# Window (ms) within which consecutive SSE frames are merged into one write; 0 disables
+SSE_COALESCE_MS = int(os.getenv("SSE_COALESCE_MS", "20"))
+
+# orjson renders every dict/list endpoint response (routers included)
+app = FastAPI(title="MedRAX API", version="1.0.0", default_response_class=ORJSONResponse)
 
-# Lock to avoid concurrent initializations
-init_lock = asyncio.Lock()
+# Worker threads for blocking work: sizes both the event loop's default executor
+# (asyncio.to_thread) and anyio's limiter (run_in_threadpool / sync endpoints)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "128"))
 
-app = FastAPI(title="MedRAX API", version="1.0.0")
+# Upload streaming chunk size (1 MiB) and hard cap on upload size
+_UPLOAD_CHUNK_SIZE = 1 << 20
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "512")) * 1024 * 1024
 
 # in-memory recent logs for diagnostics
-_RECENT_LOGS = deque(maxlen=500)
+# Fixed-size ring of (timestamp, level, message) tuples; formatted only when /api/logs is read
+_LOG_CAPACITY = 500
+_RECENT_LOGS: List[Optional[Tuple[str, str, str]]] = [None] * _LOG_CAPACITY
+_log_head = 0
+_log_count = 0
+
+_LOG_LEVELS = {"DEBUG": logging.DEBUG, "INFO": logging.INFO, "WARN": logging.WARNING, "ERROR": logging.ERROR}
+
+# stdout writes happen on a QueueListener thread so logging never blocks the event loop
+_logger = logging.getLogger("medrax.api")
+if not _logger.handlers:
+    _log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    _stdout_handler = logging.StreamHandler(sys.stdout)
+    _stdout_handler.setFormatter(logging.Formatter("[%(ts)s] %(lvl)s: %(message)s"))
+    _logger.addHandler(QueueHandler(_log_queue))
+    _logger.setLevel(logging.DEBUG)
+    _logger.propagate = False
+    _log_listener = QueueListener(_log_queue, _stdout_handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)  # flush queued lines on interpreter exit
+
+
+# Formatted timestamp is cached per wall-clock second
+_last_ts_int = 0
+_last_ts_str = ""
 
 
 def _log(level: str, *parts: Any) -> None:
-    """Simple logger that stores recent logs and prints to stdout."""
-    ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    """Simple logger that stores recent logs and writes them to stdout."""
+    global _last_ts_int, _last_ts_str, _log_head, _log_count
+    now_i = int(time.time())
+    if now_i != _last_ts_int:
+        _last_ts_int = now_i
+        _last_ts_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now_i))
+    ts = _last_ts_str
     msg = " ".join(str(p) for p in parts)
-    line = f"[{ts}] {level}: {msg}"
-    print(line)
-    _RECENT_LOGS.append(line)
+    _logger.log(_LOG_LEVELS.get(level, logging.INFO), msg, extra={"ts": ts, "lvl": level})
+    _RECENT_LOGS[_log_head] = (ts, level, msg)
+    _log_head = (_log_head + 1) % _LOG_CAPACITY
+    if _log_count < _LOG_CAPACITY:
+        _log_count += 1
+
 
+_last_iso_int = 0
+_last_iso_str = ""
+
+
+def _now_iso() -> str:
+    """UTC ISO-8601 timestamp (seconds resolution), formatted at most once per second."""
+    global _last_iso_int, _last_iso_str
+    now_i = int(time.time())
+    if now_i != _last_iso_int:
+        _last_iso_int = now_i
+        _last_iso_str = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now_i))
+    return _last_iso_str
+
+
+def _session(thread_id: str) -> Dict[str, Any]:
+    """Return the in-memory session for thread_id, creating it if needed and refreshing its TTL."""
+    sess = chat_sessions.get(thread_id)
+    if sess is None:
+        sess = {"history": [], "created_at": time.time()}
+    chat_sessions[thread_id] = sess
+    return sess
+
+
+async def _restore_session(user_payload: Dict[str, Any], thread_id: str) -> Dict[str, Any]:
+    """Like _session, but rehydrates an evicted thread's history from chat_threads on a miss."""
+    if thread_id not in chat_sessions:
+        history: List[Any] = []
+        try:
+            d = await _get_db()["chat_threads"].find_one(
+                {"userId": str(user_payload.get("sub")), "threadId": thread_id}, {"messages": 1}
+            )
+            if d:
+                history = list(d.get("messages") or [])
+        except Exception:
+            # DB unavailable: start the thread fresh, as before
+            pass
+        chat_sessions[thread_id] = {"history": history, "created_at": time.time()}
+    return _session(thread_id)
 
-def _jwt_secret() -> str:
-    return os.getenv("JWT_SECRET", "dev-secret-change-me")
+
+async def _expire_sessions_periodically(interval: float = 60.0) -> None:
+    """Evict idle sessions even when no new writes arrive to trigger TTLCache expiry."""
+    while True:
+        await asyncio.sleep(interval)
+        chat_sessions.expire()
+
+
+# Environment-derived configuration, read once at import
+_JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-change-me")
+_LAZY_INIT = os.getenv("LAZY_INIT", "false").lower() == "true"
+_FORCE_INIT = os.getenv("FORCE_INIT", "false").lower() == "true"
+_MODEL_DIR = os.getenv("MODEL_DIR", "/model-weights")
+_DEVICE = "cuda" if os.getenv("CUDA_AVAILABLE", "false").lower() == "true" else "cpu"
+_OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL")
+
+
+# Verified JWT payloads keyed by (token digest, secret); raw tokens are never stored
+_JWT_CACHE: TTLCache = TTLCache(maxsize=10000, ttl=30)
+
+
+def _jwt_cache_key(token: str, secret: str):
+    return (hashlib.blake2b(token.encode(), digest_size=16).digest(), secret)
 
 
 def _require_auth(authorization: Optional[str]):
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(status_code=401, detail="Missing token")
     token = authorization.split(" ", 1)[1]
-    payload = verify_jwt(token, _jwt_secret())
+    secret = _JWT_SECRET
+    key = _jwt_cache_key(token, secret)
+    payload = _JWT_CACHE.get(key)
+    # Re-check expiry on hits so a cached token never outlives its exp claim
+    if payload is not None and int(payload.get("exp", 0)) >= time.time():
+        return payload
+    payload = verify_jwt(token, secret)
     if not payload:
+        _JWT_CACHE.pop(key, None)
         raise HTTPException(status_code=401, detail="Invalid token")
+    _JWT_CACHE[key] = payload
     return payload
 
 # ------------------------------
@@ -83,18 +291,52 @@ PERSONAS: Dict[str, str] = {
     ),
 }
 
+# Full persona prefixes are built once; requests only pick one by role
+_PERSONA_PREFIXED: Dict[str, str] = {k: f"[Persona::{k}] {v}" for k, v in PERSONAS.items()}
+
+
 def _persona_text(role: Optional[str]) -> str:
-    key = (role or "").lower()
-    if key in PERSONAS:
-        return f"[Persona::{key}] " + PERSONAS[key]
-    return "[Persona::general] " + PERSONAS["general"]
+    return _PERSONA_PREFIXED.get((role or "").lower(), _PERSONA_PREFIXED["general"])
+
+class _UploadSizeLimit:
+    """ASGI guard that rejects an oversized /upload from its Content-Length header.
 
-# CORS for React frontend
+    FastAPI parses (and spools) the whole multipart body before the endpoint runs, so
+    the endpoint itself can only notice after the fact. Bodies without a length
+    (chunked) are still capped by the counter in upload_file.
+    """
+
+    # multipart boundaries and the small form fields ride along with the file bytes
+    _OVERHEAD = 1024 * 1024
+
+    def __init__(self, app, path: str = "/upload"):
+        self.app = app
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == self.path:
+            length = dict(scope["headers"]).get(b"content-length")
+            if length is not None and length.isdigit() and int(length) > MAX_UPLOAD_BYTES + self._OVERHEAD:
+                response = JSONResponse({"detail": "Uploaded file is too large"}, status_code=413)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+# Added before CORS so the 413 still carries CORS headers (later middleware wraps earlier)
+app.add_middleware(_UploadSizeLimit)
+
+# CORS for React frontend: explicit origin allow-list (comma-separated ALLOWED_ORIGINS)
+ALLOWED_ORIGINS = [
+    o.strip()
+    for o in os.getenv("ALLOWED_ORIGINS", "http://localhost:8080,http://127.0.0.1:8080,http://localhost:3000").split(",")
+    if o.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # development: allow all, restrict for production
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
+    allow_methods=["GET", "POST", "PATCH", "DELETE"],
     allow_headers=["*"],
 )
 
@@ -103,6 +345,7 @@ upload_dir = Path("data/uploads")
 upload_dir.mkdir(parents=True, exist_ok=True)
 temp_dir = Path("temp")
 temp_dir.mkdir(parents=True, exist_ok=True)
+_INIT_ERROR_LOG = temp_dir / "init_error.log"
 
 app.mount("/uploads", StaticFiles(directory=str(upload_dir)), name="uploads")
 app.mount("/temp", StaticFiles(directory=str(temp_dir)), name="temp")
@@ -111,56 +354,53 @@ app.mount("/temp", StaticFiles(directory=str(temp_dir)), name="temp")
 connect_to_mongo = None
 close_mongo_connection = None
 ensure_indexes = None
+
+
+def _get_db():
+    raise RuntimeError("DB utilities unavailable")
+
+
 try:
     from medrax.utils import database as _mdb
     connect_to_mongo = _mdb.connect_to_mongo
     close_mongo_connection = _mdb.close_mongo_connection
     ensure_indexes = _mdb.ensure_indexes
+    _get_db = _mdb.get_db
     _log("INFO", "DB utilities imported")
 except Exception as _e:
     _log("WARN", f"DB utilities import failed: {_e}")
 
-try:
-    from medrax.auth_api import auth_router
-    app.include_router(auth_router)
-    _log("INFO", "Auth router mounted at /api/auth")
-except Exception as _e:
-    _log("ERROR", f"Failed to mount auth router: {_e}")
-
-try:
-    from medrax.cases_api import cases_router
-    app.include_router(cases_router)
-    _log("INFO", "Cases router mounted at /api")
-except Exception as _e:
-    _log("ERROR", f"Failed to mount cases router: {_e}")
+# Feature routers: (module, router attribute, log label). Each mounts independently so one
+# broken router does not take down the rest of the API.
+_ROUTERS = (
+    ("medrax.auth_api", "auth_router", "Auth router mounted at /api/auth"),
+    ("medrax.cases_api", "cases_router", "Cases router mounted at /api"),
+    ("medrax.doctor_api", "doctor_router", "Doctor router mounted at /api/doctor"),
+    ("medrax.admin_api", "admin_router", "Admin router mounted at /api"),
+    ("medrax.lab_api", "lab_router", "Lab router mounted at /api/lab"),
+    ("medrax.patient_api", "patient_router", "Patient router mounted at /api/patient"),
+)
+for _mod_name, _attr, _label in _ROUTERS:
+    try:
+        app.include_router(getattr(importlib.import_module(_mod_name), _attr))
+        _log("INFO", _label)
+    except Exception as _e:
+        _log("ERROR", f"Failed to mount {_attr}: {_e}")
 
-try:
-    from medrax.doctor_api import doctor_router
-    app.include_router(doctor_router)
-    _log("INFO", "Doctor router mounted at /api/doctor")
-except Exception as _e:
-    _log("ERROR", f"Failed to mount doctor router: {_e}")
 
-try:
-    from medrax.admin_api import admin_router
-    app.include_router(admin_router)
-    _log("INFO", "Admin router mounted at /api")
-except Exception as _e:
-    _log("ERROR", f"Failed to mount admin router: {_e}")
+# Set once index creation has finished (or there is no DB); part of /api/health readiness
+_indexes_done = False
 
-try:
-    from medrax.lab_api import lab_router
-    app.include_router(lab_router)
-    _log("INFO", "Lab router mounted at /api/lab")
-except Exception as _e:
-    _log("ERROR", f"Failed to mount lab router: {_e}")
 
-try:
-    from medrax.patient_api import patient_router
-    app.include_router(patient_router)
-    _log("INFO", "Patient router mounted at /api/patient")
-except Exception as _e:
-    _log("ERROR", f"Failed to mount patient router: {_e}")
+async def _ensure_indexes_in_background() -> None:
+    global _indexes_done
+    try:
+        await ensure_indexes()
+        _log("INFO", "MongoDB indexes ensured")
+    except Exception as e_idx:
+        _log("WARN", f"Index creation failed or skipped: {e_idx}")
+    finally:
+        _indexes_done = True
 
 
 @app.on_event("startup")
@@ -171,19 +411,35 @@ async def on_startup():
     - If LAZY_INIT=true is set in env, skip synchronous init and defer until first request (or /api/init).
     - If FORCE_INIT=true and LAZY_INIT=true, start background initialization task (non-blocking).
     """
-    lazy = os.getenv("LAZY_INIT", "false").lower() == "true"
-    force = os.getenv("FORCE_INIT", "false").lower() == "true"
+    lazy = _LAZY_INIT
+    force = _FORCE_INIT
+
+    # Start importing the heavy ML stack right away so it overlaps with DB setup
+    global _preload_started
+    _preload_started = True
+    threading.Thread(target=_preload_ml_modules, name="medrax-preload", daemon=True).start()
+
+    # Agent steps, upload post-processing, bcrypt and the preload wait go through
+    # asyncio.to_thread, i.e. the loop's default executor (min(32, cpu+4) workers unless
+    # replaced); sync endpoints and run_in_threadpool use anyio's limiter (40 tokens).
+    # Both saturate quickly with concurrent chats and uploads.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=THREADPOOL_SIZE, thread_name_prefix="medrax-io")
+    )
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    asyncio.create_task(_expire_sessions_periodically())
+    asyncio.create_task(_flush_thread_writes_periodically())
 
     # Attempt DB connection first (non-fatal if not configured)
+    global _indexes_done
     try:
-        # connect and ensure indexes if DB variables are set
+        # connect if DB variables are set; index builds run in the background
         await connect_to_mongo()  # may raise if MONGODB_URI missing
-        try:
-            await ensure_indexes()
-            _log("INFO", "MongoDB connected and indexes ensured")
-        except Exception as e_idx:
-            _log("WARN", f"Index creation failed or skipped: {e_idx}")
+        _log("INFO", "MongoDB connected")
+        asyncio.create_task(_ensure_indexes_in_background())
     except Exception as e_db:
+        _indexes_done = True  # nothing to wait for without a DB
         _log("WARN", f"MongoDB connection skipped or failed: {e_db}")
 
     if lazy:
@@ -198,7 +454,7 @@ async def on_startup():
     try:
         await initialize_medrax()
         if initialization_error:
-            _log("ERROR", "Initialization failed during startup:", initialization_error)
+            _log("ERROR", "Initialization failed during startup:", initialization_error["msg"])
         else:
             _log("INFO", "MedRAX initialized successfully at startup")
     except Exception as e:
@@ -208,6 +464,7 @@ async def on_startup():
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    await _flush_thread_writes()
     try:
         await close_mongo_connection()
         _log("INFO", "MongoDB connection closed")
@@ -222,97 +479,104 @@ class ChatMessage(BaseModel):
     image_path: Optional[str] = None
 
 
+async def _prewarm_ollama(model_name: str) -> None:
+    """Load the chat model into Ollama ahead of the first chat (best-effort).
+
+    A generate request without a prompt only loads the model and applies keep_alive.
+    """
+    try:
+        async with httpx.AsyncClient(base_url=_OLLAMA_BASE_URL or "http://localhost:11434", timeout=300.0) as client:
+            await client.post(
+                "/api/generate",
+                json={"model": model_name, "keep_alive": os.getenv("OLLAMA_KEEP_ALIVE", "30m")},
+            )
+        _log("INFO", f"✓ Ollama model {model_name} loaded")
+    except Exception as e:
+        _log("WARN", f"⚠️ Ollama prewarm failed: {e}")
+
+
 async def initialize_medrax():
     """Lazy initialization of MedRAX components.
 
-    This is safe to call from multiple endpoints; init_lock prevents concurrent inits.
+    This is safe to call from multiple endpoints; the first caller performs the init
+    and everyone else waits on _init_done.
     """
-    global agent, tools_dict, chat_interface, initialization_error, initialization_error_msg, initialization_error_tb
+    global agent, tools_dict, chat_interface, initialization_error
+    global _init_started
 
-    # Fast path: already initialized
-    if agent is not None:
+    # Fast path: already initialized (or failed)
+    if _init_done.is_set():
         return
+    if _init_started:
+        await _init_done.wait()
+        return
+    _init_started = True
 
-    async with init_lock:
-        # Another waiter may have completed initialization while we waited
-        if agent is not None or initialization_error is not None:
-            return
-
-        try:
-            _log("INFO", "🚀 Initializing MedRAX components (lazy init)...")
-            # Local imports to avoid pulling heavy ML libs at module import time
-            from main import initialize_agent
-            from interface import ChatInterface
-            from dotenv import load_dotenv
-            import requests
+    try:
+        _log("INFO", "🚀 Initializing MedRAX components (lazy init)...")
 
-            load_dotenv()
+        # Let the startup warmup finish importing instead of racing it for the import lock
+        if _preload_started and not _PRELOAD_DONE.is_set():
+            await asyncio.to_thread(_PRELOAD_DONE.wait, _PRELOAD_TIMEOUT)
 
-            # Quick ping to Ollama (if your setup uses it)
+        # Ask Ollama once which models are pulled; awaited so the event loop stays free
+        candidates = _FUNCTION_CALLING_MODELS
+        try:
+            async with httpx.AsyncClient(base_url=_OLLAMA_BASE_URL or "http://localhost:11434", timeout=1.0) as client:
+                tags = (await client.get("/api/tags")).json()
+            _log("INFO", "✓ Ollama server reachable")
+            candidates = _main.filter_pulled_models(_FUNCTION_CALLING_MODELS, tags)
+            if not candidates:
+                raise Exception(f"None of {', '.join(_FUNCTION_CALLING_MODELS)} is pulled in Ollama")
+        except (httpx.HTTPError, ValueError) as e:
+            # Not fatal here — models may be local or different setup — warn instead
+            _log("WARN", f"⚠️ Ollama ping failed: {e}")
+
+        # Try models in order until one succeeds
+        for model_name in candidates:
             try:
-                requests.get("http://localhost:11434", timeout=5)
-                _log("INFO", "✓ Ollama server reachable")
+                _log("INFO", f"Trying model: {model_name}")
+                ollama_kwargs = {}
+                if _OLLAMA_BASE_URL:
+                    ollama_kwargs["base_url"] = _OLLAMA_BASE_URL
+
+                agent, tools_dict = _main.initialize_agent(
+                    "medrax/docs/system_prompts.txt",
+                    tools_to_use=_SELECTED_TOOLS,
+                    model_dir=_MODEL_DIR,
+                    temp_dir=str(temp_dir),
+                    device=_DEVICE,
+                    model=model_name,
+                    temperature=0.1,
+                    ollama_kwargs=ollama_kwargs,
+                )
+                _log("INFO", f"✅ Initialized agent with {model_name}")
+                _spawn(_prewarm_ollama(model_name))
+                break
             except Exception as e:
-                # Not fatal here — models may be local or different setup — warn instead
-                _log("WARN", f"⚠️ Ollama ping failed: {e}")
-
-            # Tools and model choices — keep aligned with main.initialize_agent
-            selected_tools = [
-                "ImageVisualizerTool",
-                "DicomProcessorTool",
-                "ChestXRayClassifierTool",
-                "ChestXRaySegmentationTool",
-                "ChestXRayReportGeneratorTool",
-                "XRayVQATool",
-                "LlavaMedTool",
-                "XRayPhraseGroundingTool",
-            ]
-
-            function_calling_models = [
-                "qwen2.5:7b",
-                "mistral:latest",
-            ]
-
-            # Try models in order until one succeeds
-            for model_name in function_calling_models:
-                try:
-                    _log("INFO", f"Trying model: {model_name}")
-                    ollama_kwargs = {}
-                    if base_url := os.getenv("OLLAMA_BASE_URL"):
-                        ollama_kwargs["base_url"] = base_url
-
-                    agent, tools_dict = initialize_agent(
-                        "medrax/docs/system_prompts.txt",
-                        tools_to_use=selected_tools,
-                        model_dir=os.getenv("MODEL_DIR", "/model-weights"),
-                        temp_dir=str(temp_dir),
-                        device=("cuda" if os.getenv("CUDA_AVAILABLE", "false").lower() == "true" else "cpu"),
-                        model=model_name,
-                        temperature=0.1,
-                        ollama_kwargs=ollama_kwargs,
-                    )
-                    _log("INFO", f"✅ Initialized agent with {model_name}")
-                    break
-                except Exception as e:
-                    _log("ERROR", f"Model {model_name} failed: {e}")
-                    continue
+                _log("ERROR", f"Model {model_name} failed: {e}")
+                continue
 
-            if agent is None:
-                raise Exception("Failed to initialize any configured LLM/model")
+        if agent is None:
+            raise Exception("Failed to initialize any configured LLM/model")
 
-            chat_interface = ChatInterface(agent, tools_dict)
-            _log("INFO", "✅ MedRAX chat interface ready")
+        chat_interface = _interface.ChatInterface(agent, tools_dict)
+        _log("INFO", "✅ MedRAX chat interface ready")
 
-        except Exception as e:
-            # capture full traceback for diagnostics
-            tb = traceback.format_exc()
-            initialization_error_msg = str(e)
-            initialization_error_tb = tb
-            initialization_error = initialization_error_msg
-            _log("ERROR", "❌ MedRAX initialization error:", initialization_error_msg)
-            _log("ERROR", tb)
-            # Keep the exception for endpoints to report
-            return
+    except Exception as e:
+        # keep only a compact error in memory; the full traceback is dumped to disk for diagnostics
+        tb = traceback.format_exc()
+        initialization_error = {"msg": str(e), "type": type(e).__name__}
+        try:
+            _INIT_ERROR_LOG.write_text(tb, encoding="utf-8")
+        except OSError:
+            pass
+        _log("ERROR", "❌ MedRAX initialization error:", initialization_error["msg"])
+        _log("ERROR", tb)
+        # Keep the exception for endpoints to report
+        return
+    finally:
+        _init_done.set()
 
 
 @app.post("/api/init")
@@ -320,35 +584,41 @@ async def manual_init():
     """Trigger initialization manually (useful during testing)."""
     await initialize_medrax()
     if initialization_error:
-        return JSONResponse({"success": False, "error": initialization_error, "traceback": initialization_error_tb}, status_code=500)
+        return JSONResponse({"success": False, "error": initialization_error}, status_code=500)
     return {"success": True}
 
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...), case_id: Optional[str] = Form(None), modality: Optional[str] = Form(None), Authorization: Optional[str] = Header(None)):
-    """Upload an image or DICOM file and return paths for preview and processing."""
-    try:
-        _require_auth(Authorization)
-        if not file:
-            return JSONResponse({"error": "No file uploaded", "original_path": "", "display_path": ""}, status_code=400)
+@app.post("/api/auth/invalidate")
+async def invalidate_auth(Authorization: Optional[str] = Header(None)):
+    """Drop the caller's token from the verification cache (called on logout)."""
+    _require_auth(Authorization)
+    token = Authorization.split(" ", 1)[1]
+    _JWT_CACHE.pop(_jwt_cache_key(token, _JWT_SECRET), None)
+    return {"success": True}
 
-        timestamp = int(time.time())
-        ext = Path(file.filename).suffix if file.filename else ""
-        saved_filename = f"upload_{timestamp}{ext}"
-        file_path = upload_dir / saved_filename
 
-        # write file
-        content = await file.read()
-        file_path.write_bytes(content)
+@app.get("/api/init/traceback")
+async def init_traceback():
+    """Return the full traceback of the last initialization failure, if any."""
+    if not initialization_error or not _INIT_ERROR_LOG.exists():
+        raise HTTPException(status_code=404, detail="No initialization error recorded")
+    async with aiofiles.open(_INIT_ERROR_LOG, "r", encoding="utf-8") as f:
+        return {"error": initialization_error, "traceback": await f.read()}
+
 
+async def _process_upload(file_path: Path, saved_filename: str, filename: str, case_id: Optional[str], modality: Optional[str], payload: Dict[str, Any]) -> None:
+    """Background post-processing for /upload: DICOM conversion, modality sniffing, case attach."""
+    status = upload_status.setdefault(saved_filename, {"status": "processing"})
+    try:
         # Ensure backend is ready
         await initialize_medrax()
         if initialization_error:
-            return {"error": f"Initialization failed: {initialization_error}", "original_path": str(file_path), "display_path": f"/uploads/{saved_filename}", "traceback": initialization_error_tb}
+            status.update({"status": "failed", "error": f"Initialization failed: {initialization_error['msg']}"})
+            return
 
-        # Let the ChatInterface process the upload (may convert DICOM etc.)
+        # Let the ChatInterface process the upload (may convert DICOM etc.) off the event loop
         try:
-            display_path = chat_interface.handle_upload(str(file_path))
+            display_path = await asyncio.to_thread(chat_interface.handle_upload, str(file_path))
         except Exception as e:
             # If chat_interface handling fails, don't block upload preview
             _log("ERROR", f"Upload post-processing failed: {e}")
@@ -358,9 +628,8 @@ async def upload_file(file: UploadFile = File(...), case_id: Optional[str] = For
         display_path = display_path or f"/uploads/{saved_filename}"
 
         # Detect DICOM modality if not provided
-        if not modality and (file.filename or "").lower().endswith(".dcm"):
+        if not modality and pydicom is not None and (filename or "").lower().endswith(".dcm"):
             try:
-                import pydicom  # type: ignore
                 ds = pydicom.dcmread(str(file_path), stop_before_pixels=True)
                 mod = getattr(ds, "Modality", None)
                 modality = mod if isinstance(mod, str) else None
@@ -370,39 +639,108 @@ async def upload_file(file: UploadFile = File(...), case_id: Optional[str] = For
         # If a case_id was provided, attach this image to that case
         if case_id:
             try:
-                from medrax.utils.jwt import verify_jwt
-                from medrax.utils.database import get_db
-                def _jwt_secret() -> str:
-                    return os.getenv("JWT_SECRET", "dev-secret-change-me")
-                # require auth and push to case
-                if not Authorization or not Authorization.lower().startswith("bearer "):
-                    raise Exception("Missing token")
-                token = Authorization.split(" ", 1)[1]
-                payload = verify_jwt(token, _jwt_secret())
-                if not payload:
-                    raise Exception("Invalid token")
-                db = get_db()
-                case = await db["cases"].find_one({"caseId": case_id})
-                if case:
-                    entry = {
-                        "_id": f"auto_{saved_filename}",
-                        "original_path": original_path,
-                        "display_path": display_path,
-                        "modality": modality,
-                        "uploadedAt": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
-                        "uploadedBy": str(payload.get("sub")),
-                    }
-                    await db["cases"].update_one({"_id": case.get("_id")}, {"$push": {"images": entry}, "$set": {"updatedAt": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())}})
+                db = _get_db()
+                now_iso = _now_iso()
+                entry = {
+                    "_id": f"auto_{saved_filename}",
+                    "original_path": original_path,
+                    "display_path": display_path,
+                    "modality": modality,
+                    "uploadedAt": now_iso,
+                    "uploadedBy": str(payload.get("sub")),
+                }
+                # Single round trip; a missing case simply matches nothing
+                await db["cases"].update_one({"caseId": case_id}, {"$push": {"images": entry}, "$set": {"updatedAt": now_iso}})
             except Exception as e:
                 _log("WARN", f"Auto-attach to case {case_id} failed: {e}")
 
-        return {"original_path": original_path, "display_path": display_path}
+        status.update({"status": "ready", "display_path": display_path, "modality": modality})
+    except Exception as e:
+        _log("ERROR", f"Upload processing error: {e}")
+        status.update({"status": "failed", "error": str(e)})
+    finally:
+        event = _upload_events.pop(saved_filename, None)
+        if event is not None:
+            event.set()
+
+
+async def _await_upload(image_path: Optional[str]) -> None:
+    """Wait until a pending /upload of `image_path` has been post-processed."""
+    event = _upload_events.get(Path(image_path).name) if image_path else None
+    if event is None:
+        return
+    try:
+        await asyncio.wait_for(event.wait(), timeout=UPLOAD_WAIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        _log("WARN", f"Upload {image_path} still processing after {UPLOAD_WAIT_TIMEOUT}s; chatting anyway")
+
+
+@app.post("/upload", status_code=202)
+async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...), case_id: Optional[str] = Form(None), modality: Optional[str] = Form(None), Authorization: Optional[str] = Header(None)):
+    """Upload an image or DICOM file and return paths for preview and processing.
+
+    The bytes are saved synchronously; DICOM conversion and case attachment run in the
+    background. Poll `status_url` for the converted `display_path`.
+    """
+    try:
+        payload = _require_auth(Authorization)
+        if not file:
+            return JSONResponse({"error": "No file uploaded", "original_path": "", "display_path": ""}, status_code=400)
+
+        ext = Path(file.filename).suffix if file.filename else ""
+        # Random, not time-based: the name doubles as the public processing id, so it must
+        # neither collide between same-second uploads nor be guessable by other users
+        saved_filename = f"upload_{uuid.uuid4().hex}{ext}"
+        file_path = upload_dir / saved_filename
+
+        # write file in chunks so large DICOMs never sit fully in memory or block the loop
+        total = 0
+        async with aiofiles.open(file_path, "wb") as out:
+            while chunk := await file.read(_UPLOAD_CHUNK_SIZE):
+                total += len(chunk)
+                if total > MAX_UPLOAD_BYTES:
+                    break
+                await out.write(chunk)
+        if total > MAX_UPLOAD_BYTES:
+            file_path.unlink(missing_ok=True)
+            raise HTTPException(status_code=413, detail="Uploaded file is too large")
+
+        original_path = str(file_path)
+        display_path = f"/uploads/{saved_filename}"
+        upload_status[saved_filename] = {
+            "status": "processing",
+            "original_path": original_path,
+            "display_path": display_path,
+            "owner": str(payload.get("sub")),
+        }
+        _upload_events[saved_filename] = asyncio.Event()
+        background_tasks.add_task(_process_upload, file_path, saved_filename, file.filename or "", case_id, modality, payload)
 
+        return {
+            "original_path": original_path,
+            "display_path": display_path,
+            "processing_id": saved_filename,
+            "status_url": f"/upload/status/{saved_filename}",
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
         _log("ERROR", f"Upload error: {e}")
         return JSONResponse({"error": str(e), "original_path": "", "display_path": ""}, status_code=500)
 
 
+@app.get("/upload/status/{processing_id}")
+async def upload_status_endpoint(processing_id: str, Authorization: Optional[str] = Header(None)):
+    """Return the background processing state of an upload ("processing", "ready" or "failed")."""
+    payload = _require_auth(Authorization)
+    status = upload_status.get(processing_id)
+    # Other users' uploads are indistinguishable from unknown ones
+    if status is None or status.get("owner") != str(payload.get("sub")):
+        raise HTTPException(status_code=404, detail="Unknown upload")
+    return {"processing_id": processing_id, **{k: v for k, v in status.items() if k != "owner"}}
+
+
 def _serialize_msg(msg) -> Dict[str, Any]:
     """Serialize ChatMessage-like objects or simple dicts for persistence/streaming."""
     # gradio.ChatMessage or pydantic-like
@@ -426,204 +764,360 @@ def _serialize_msg(msg) -> Dict[str, Any]:
     }
 
 
-def sse_event(data: str) -> str:
-    return f"data: {data}\n\n"
+# Debounced chat_threads write-back: streams overwrite their pending $set fields and a
+# single background task flushes all dirty threads with one bulk_write per interval.
+THREAD_FLUSH_INTERVAL = 0.5
+_PENDING_WRITES: Dict[Any, Dict[str, Any]] = {}
+_flush_lock = asyncio.Lock()
+
+
+def _queue_thread_write(user_payload: Dict[str, Any], thread_id: str, fields: Dict[str, Any]) -> None:
+    """Record the latest chat_threads fields for (user, thread); flushed by _flush_thread_writes."""
+    key = (str(user_payload.get("sub")), thread_id)
+    pending = _PENDING_WRITES.get(key)
+    if pending is None:
+        _PENDING_WRITES[key] = dict(fields)
+    else:
+        pending.update(fields)
+
+
+async def _flush_thread_writes() -> None:
+    """Upsert all pending chat_threads updates in one bulk_write (best-effort)."""
+    async with _flush_lock:
+        if not _PENDING_WRITES:
+            return
+        batch = list(_PENDING_WRITES.items())
+        _PENDING_WRITES.clear()
+        try:
+            from pymongo import UpdateOne
+            db = _get_db()
+            now_iso = _now_iso()
+            ops = [
+                UpdateOne(
+                    {"userId": user_id, "threadId": thread_id},
+                    {"$set": fields, "$setOnInsert": {"createdAt": now_iso}},
+                    upsert=True,
+                )
+                for (user_id, thread_id), fields in batch
+            ]
+            await db["chat_threads"].bulk_write(ops, ordered=False)
+        except Exception:
+            # Do not disrupt streaming if DB is unavailable
+            pass
+
+
+async def _flush_thread_writes_periodically() -> None:
+    while True:
+        await asyncio.sleep(THREAD_FLUSH_INTERVAL)
+        await _flush_thread_writes()
+
+
+# Strong refs to fire-and-forget tasks so they are not garbage-collected mid-flight
+_BACKGROUND_TASKS: set = set()
+
+
+def _spawn(coro) -> None:
+    task = asyncio.create_task(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+
+
+async def _delete_thread_doc(db, user_id: str, thread_id: str) -> None:
+    """Delete a persisted thread off the request path (best-effort).
+
+    Runs under _flush_lock so an in-flight debounced flush can't re-upsert it afterwards.
+    """
+    async with _flush_lock:
+        _PENDING_WRITES.pop((user_id, thread_id), None)
+        try:
+            await db["chat_threads"].delete_one({"userId": user_id, "threadId": thread_id})
+        except Exception:
+            pass
+
+
+_GREETING_RE = re.compile(r"\b(hi|hello|hey|good\s*(morning|evening|afternoon))\b", re.I)
+# Cheap first-word prefilter so ordinary questions never reach the regex engine
+_GREET_WORDS = ("hi", "hello", "hey", "good")
+
+
+def sse_event(data: Dict[str, Any]) -> bytes:
+    """Encode one SSE frame; orjson emits UTF-8 bytes that StreamingResponse writes as-is."""
+    return b"data: " + orjson.dumps(data) + b"\n\n"
+
+
+# Seconds between SSE keep-alive comments while the agent is busy (e.g. long tool runs)
+SSE_PING_SECONDS = 15
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _sse_response(frames):
+    """Wrap an iterator of pre-framed SSE bytes in a streaming response."""
+    if EventSourceResponse is not None:
+        # bytes are passed through untouched; "\n" keeps pings splittable on blank lines
+        return EventSourceResponse(frames, ping=SSE_PING_SECONDS, sep="\n", headers=_SSE_HEADERS)
+    return StreamingResponse(frames, media_type="text/event-stream", headers=_SSE_HEADERS)
+
+
+def _strip_persona_prefix(txt: Optional[str]) -> str:
+    """Drop a server-injected "[Persona::role] ...\n\n" prefix from a user message."""
+    if not txt:
+        return ""
+    if txt[:10] != "[Persona::":
+        return txt
+    parts = txt.split("\n\n", 1)
+    return parts[1] if len(parts) == 2 else txt
+
+
+def _upload_display_path(image_path: Optional[str]) -> Optional[str]:
+    """Viewable path recorded by /upload for `image_path`, if it came from there."""
+    if not image_path:
+        return None
+    return (upload_status.get(Path(image_path).name) or {}).get("display_path")
 
 
 async def _chat_stream_generator(message: str, image_path: Optional[str], thread_id: str, user_payload: Optional[Dict[str, Any]] = None, case_id: Optional[str] = None):
-    """Internal generator that proxies ChatInterface.process_message to SSE JSON events."""
-    try:
-        def _strip_persona_prefix(txt: Optional[str]) -> str:
-            if not txt:
-                return ""
-            # If message was prefixed with persona (e.g., "[Persona::role]...\n\n<user text>"), drop the persona
-            if txt.startswith("[Persona::"):
-                parts = txt.split("\n\n", 1)
-                if len(parts) == 2:
-                    return parts[1]
-            return txt
+    """Internal generator that proxies ChatInterface.process_message to SSE JSON events.
 
+    All per-chat state (thread id, image, display path) stays local to this stream;
+    the shared chat_interface is only used through its per-request mode.
+    """
+    try:
+        display = _upload_display_path(image_path)
+        # The persona-free user text is needed for history and the greeting check; strip it once
+        user_text = _strip_persona_prefix(message)
         history = chat_sessions.get(thread_id, {}).get("history", [])
 
+        # Per-stream memo of serialized messages keyed by object identity; every message stays
+        # referenced by `history` for the generator's lifetime, so ids cannot be recycled.
+        serialized_by_id: Dict[int, Dict[str, Any]] = {}
+
+        def _serialize_cached(m) -> Dict[str, Any]:
+            key = id(m)
+            out = serialized_by_id.get(key)
+            if out is None:
+                out = serialized_by_id[key] = _serialize_msg(m)
+            return out
+
         # Ensure user's turn is represented in server history before assistant streams
         pre_msgs = []
         if image_path:
             # Use simple dicts for history to ensure role/content persist correctly.
             img_entry = {"path": image_path}
-            try:
-                disp = getattr(chat_interface, "display_file_path", None)
-                if disp:
-                    img_entry["display_path"] = disp
-            except Exception:
-                pass
+            if display:
+                img_entry["display_path"] = display
             pre_msgs.append({"role": "user", "content": img_entry})
         if message:
-            pre_msgs.append({"role": "user", "content": _strip_persona_prefix(message)})
+            pre_msgs.append({"role": "user", "content": user_text})
         if pre_msgs:
             history = history + pre_msgs
-            chat_sessions.setdefault(thread_id, {})["history"] = history
-            # Persist immediately (best-effort) so restored threads include user's messages
-            try:
-                if user_payload:
-                    from medrax.utils.database import get_db
-                    db = get_db()
-                    now_iso = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
-                    doc = {
-                        "userId": str(user_payload.get("sub")),
-                        "role": user_payload.get("role"),
-                        "threadId": thread_id,
-                        "caseId": case_id,
-                        "messages": [_serialize_msg(m) for m in history],
-                        "display_path": getattr(chat_interface, "display_file_path", None),
-                        "updatedAt": now_iso,
-                        "lastMessageAt": now_iso,
-                    }
-                    await db["chat_threads"].update_one(
-                        {"userId": doc["userId"], "threadId": thread_id},
-                        {"$set": doc, "$setOnInsert": {"createdAt": now_iso}},
-                        upsert=True,
-                    )
-            except Exception:
-                pass
+            _session(thread_id)["history"] = history
+            # Queue for persistence so restored threads include user's messages
+            if user_payload:
+                now_iso = _now_iso()
+                _queue_thread_write(user_payload, thread_id, {
+                    "userId": str(user_payload.get("sub")),
+                    "role": user_payload.get("role"),
+                    "threadId": thread_id,
+                    "caseId": case_id,
+                    "messages": [_serialize_cached(m) for m in history],
+                    "display_path": display,
+                    "updatedAt": now_iso,
+                    "lastMessageAt": now_iso,
+                })
 
         # Special-case: greetings without image — reply succinctly and do NOT call tools
-        user_text = _strip_persona_prefix(message)
-        if (not image_path) and user_text and len(user_text.strip()) <= 40:
-            import re
-            if re.search(r"\b(hi|hello|hey|good\s*(morning|evening|afternoon))\b", user_text.strip(), re.I):
+        stripped = user_text.strip()
+        if (not image_path) and stripped and len(stripped) <= 40 and stripped.split(None, 1)[0].lower().startswith(_GREET_WORDS):
+            if _GREETING_RE.search(stripped):
                 assist = {"role": "assistant", "content": "Hello! How can I help you today? If you have a chest X-ray, you can upload it and I’ll analyze it."}
                 history = history + [assist]
-                chat_sessions.setdefault(thread_id, {})["history"] = history
+                _session(thread_id)["history"] = history
                 response_data = {
                     "thread_id": thread_id,
-                    "messages": history,
-                    "display_path": getattr(chat_interface, "display_file_path", None),
+                    "messages": [_serialize_cached(m) for m in history],
+                    "display_path": display,
                     "status": "completed",
                 }
-                # Persist
-                try:
-                    if user_payload:
-                        from medrax.utils.database import get_db
-                        db = get_db()
-                        now_iso = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
-                        doc = {
-                            "userId": str(user_payload.get("sub")),
-                            "role": user_payload.get("role"),
-                            "threadId": thread_id,
-                            "caseId": case_id,
-                            "messages": response_data["messages"],
-                            "display_path": response_data["display_path"],
-                            "updatedAt": now_iso,
-                            "lastMessageAt": now_iso,
-                        }
-                        await db["chat_threads"].update_one(
-                            {"userId": doc["userId"], "threadId": thread_id},
-                            {"$set": doc, "$setOnInsert": {"createdAt": now_iso}},
-                            upsert=True,
-                        )
-                except Exception:
-                    pass
-                yield sse_event(json.dumps(response_data))
-                return
-
-        async for updated_history, display_path, _ in chat_interface.process_message(message, image_path, history):
-            # Update session history
-            chat_sessions.setdefault(thread_id, {})["history"] = updated_history
-
-            response_data = {
-                "thread_id": thread_id,
-                "messages": [_serialize_msg(m) for m in updated_history],
-                "display_path": display_path,
-                "status": "streaming",
-            }
-
-            # Persist chat history incrementally (best-effort; non-blocking on failure)
-            try:
+                # Persist immediately; the turn is complete
                 if user_payload:
-                    from medrax.utils.database import get_db
-                    db = get_db()
-                    now_iso = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
-                    doc = {
+                    now_iso = _now_iso()
+                    _queue_thread_write(user_payload, thread_id, {
                         "userId": str(user_payload.get("sub")),
                         "role": user_payload.get("role"),
                         "threadId": thread_id,
                         "caseId": case_id,
                         "messages": response_data["messages"],
-                        "display_path": display_path,
+                        "display_path": response_data["display_path"],
                         "updatedAt": now_iso,
                         "lastMessageAt": now_iso,
-                    }
-                    # Upsert by (userId, threadId)
-                    await db["chat_threads"].update_one(
-                        {"userId": doc["userId"], "threadId": thread_id},
-                        {"$set": doc, "$setOnInsert": {"createdAt": now_iso}},
-                        upsert=True,
-                    )
-            except Exception as _e:
-                # Do not disrupt streaming if DB is unavailable
-                pass
+                    })
+                    await _flush_thread_writes()
+                yield sse_event(response_data)
+                return
 
-            yield sse_event(json.dumps(response_data))
+        # Streaming frames only carry messages appended since the previous frame ("offset" is the
+        # index of the first one); the serialized history is grown incrementally for persistence.
+        serialized = [_serialize_cached(m) for m in history]
+        async for updated_history, display_path, _ in chat_interface.process_message(message, image_path, history, thread_id=thread_id):
+            display = display_path or display
+            # Update session history
+            _session(thread_id)["history"] = updated_history
 
-        # final
+            offset = len(serialized)
+            serialized.extend(_serialize_cached(m) for m in updated_history[offset:])
+            response_data = {
+                "thread_id": thread_id,
+                "messages": serialized[offset:],
+                "offset": offset,
+                "display_path": display,
+                "status": "streaming",
+            }
+
+            # Persist chat history incrementally; the flush loop coalesces ticks into one write
+            if user_payload:
+                now_iso = _now_iso()
+                _queue_thread_write(user_payload, thread_id, {
+                    "userId": str(user_payload.get("sub")),
+                    "role": user_payload.get("role"),
+                    "threadId": thread_id,
+                    "caseId": case_id,
+                    # snapshot: `serialized` keeps growing while the write is in flight
+                    "messages": list(serialized),
+                    "display_path": display,
+                    "updatedAt": now_iso,
+                    "lastMessageAt": now_iso,
+                })
+
+            yield sse_event(response_data)
+
+        # final: full snapshot so clients can reconcile any missed deltas
         final = {
             "thread_id": thread_id,
-            "messages": [_serialize_msg(m) for m in chat_sessions.get(thread_id, {}).get("history", [])],
-            "display_path": getattr(chat_interface, "display_file_path", None),
+            "messages": serialized,
+            "display_path": display,
             "status": "completed",
         }
-        # Final persist to ensure completion state is saved
-        try:
-            if user_payload:
-                from medrax.utils.database import get_db
-                db = get_db()
-                now_iso = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
-                await db["chat_threads"].update_one(
-                    {"userId": str(user_payload.get("sub")), "threadId": thread_id},
-                    {"$set": {
-                        "messages": final["messages"],
-                        "display_path": final["display_path"],
-                        "updatedAt": now_iso,
-                        "lastMessageAt": now_iso,
-                        "caseId": case_id,
-                    }, "$setOnInsert": {"createdAt": now_iso}},
-                    upsert=True,
-                )
-        except Exception:
-            pass
-        yield sse_event(json.dumps(final))
+        # Final persist flushes immediately to ensure completion state is saved
+        if user_payload:
+            now_iso = _now_iso()
+            _queue_thread_write(user_payload, thread_id, {
+                "messages": final["messages"],
+                "display_path": final["display_path"],
+                "updatedAt": now_iso,
+                "lastMessageAt": now_iso,
+                "caseId": case_id,
+            })
+            await _flush_thread_writes()
+        yield sse_event(final)
 
     except Exception as e:
         tb = traceback.format_exc()
         _log("ERROR", "Chat generator error:", str(e))
         _log("ERROR", tb)
         err = {"thread_id": thread_id, "error": str(e), "status": "error", "traceback": tb}
-        yield sse_event(json.dumps(err))
+        yield sse_event(err)
 
 
-@app.post("/chat")
-async def chat_endpoint(message: str = Form(...), image_path: Optional[str] = Form(None), thread_id: Optional[str] = Form(None), case_id: Optional[str] = Form(None), Authorization: Optional[str] = Header(None)):
-    """SSE chat endpoint compatible with the existing frontend.
+class _ChatSlot:
+    """One acquired _chat_sem permit, released exactly once."""
 
-    The endpoint lazy-initializes the MedRAX backend if needed.
+    __slots__ = ("_held",)
+
+    def __init__(self):
+        self._held = True
+
+    def release(self) -> None:
+        if self._held:
+            self._held = False
+            _chat_sem.release()
+
+    def __del__(self):
+        # Safety net: a response that is never iterated (client gone first) still frees its slot
+        self.release()
+
+
+async def _admit_chat() -> _ChatSlot:
+    """Take a chat slot now, or reject with 429 when all are busy."""
+    if _chat_sem.locked():
+        raise HTTPException(status_code=429, detail="Too many concurrent chats, please retry shortly")
+    # An unlocked semaphore's acquire() never suspends, so check-and-take is atomic on the loop
+    await _chat_sem.acquire()
+    return _ChatSlot()
+
+
+async def _gated_stream(gen, slot: _ChatSlot):
+    """Release the admitted chat slot when the wrapped SSE generator finishes."""
+    try:
+        async for ev in gen:
+            yield ev
+    finally:
+        slot.release()
+
+
+async def _coalesce_frames(gen, window: float):
+    """Merge SSE frames produced within `window` seconds into a single write.
+
+    A buffered frame is never held longer than the window: if the agent goes quiet
+    (e.g. during a slow tool call) the buffer is flushed while awaiting the next frame.
+    """
+    if window <= 0:
+        async for ev in gen:
+            yield ev
+        return
+
+    buf: List[bytes] = []
+    pending = None
+    flush_at = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(gen.__anext__())
+            timeout = None if flush_at is None else max(0.0, flush_at - time.monotonic())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield b"".join(buf)
+                buf.clear()
+                flush_at = None
+                continue
+            task, pending = pending, None
+            try:
+                buf.append(task.result())
+            except StopAsyncIteration:
+                break
+            if flush_at is None:
+                flush_at = time.monotonic() + window
+        if buf:
+            yield b"".join(buf)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        await gen.aclose()
+
+
+async def _prepare_chat(payload: Dict[str, Any], message: str, image_path: Optional[str], thread_id: Optional[str], case_id: Optional[str] = None):
+    """Shared bootstrap for the chat SSE endpoints.
+
+    Lazy-initializes MedRAX (falling back to the mock stream on failure), applies
+    case and persona context to the message, and opens the gated agent stream.
     """
-    payload = _require_auth(Authorization)
     await initialize_medrax()
     if initialization_error:
         _log("WARN", "Initialization failed - falling back to mock stream for chat")
         # Fall back to mock stream so frontend behaves exactly and doesn't show raw error
-        return StreamingResponse(_mock_stream_generator(message, image_path, str(time.time())), media_type="text/event-stream")
+        return _sse_response(_mock_stream_generator(message, image_path, str(time.time())))
+    # A chat sent right after /upload must not run before that upload is post-processed
+    await _await_upload(image_path)
 
     # If case_id is provided, and no image_path provided, try to auto-use latest case image
     if case_id:
         try:
-            from medrax.utils.database import get_db
-            db = get_db()
-            c = await db["cases"].find_one({"caseId": case_id})
+            db = _get_db()
+            c = await db["cases"].find_one({"caseId": case_id}, {"images": 1, "patient": 1})
             if c:
                 imgs = c.get("images", [])
                 if (not image_path) and imgs:
-                    latest = sorted(imgs, key=lambda x: x.get("uploadedAt", ""))[-1]
+                    latest = max(imgs, key=lambda x: x.get("uploadedAt", ""))
                     image_path = latest.get("original_path") or image_path
                 # Prepend patient context to the message (lightweight context injection)
                 p = c.get("patient", {})
@@ -632,94 +1126,109 @@ async def chat_endpoint(message: str = Form(...), image_path: Optional[str] = Fo
         except Exception:
             pass
 
-    # Inject persona based on JWT role without changing response shape
-    try:
-        persona = _persona_text(payload.get("role"))
-        message = f"{persona}\n\n" + (message or "")
-    except Exception:
-        pass
+    # Inject persona based on JWT role without changing response shape; an image-only
+    # turn gets no prefix, so the agent never receives a persona-only prompt
+    if message:
+        try:
+            persona = _persona_text(payload.get("role"))
+            message = f"{persona}\n\n" + message
+        except Exception:
+            pass
 
-    tid = thread_id or str(time.time())
-    # ensure session exists
-    chat_sessions.setdefault(tid, {"history": [], "created_at": time.time()})
-    # set current thread if chat_interface supports it
-    try:
-        setattr(chat_interface, "current_thread_id", tid)
-    except Exception:
-        pass
+    tid = thread_id or uuid.uuid4().hex
+    # ensure session exists (restoring an evicted thread from Mongo if needed)
+    if thread_id:
+        await _restore_session(payload, tid)
+    else:
+        _session(tid)
+    # Admit last: nothing between taking the slot and handing it to the stream can await or fail
+    slot = await _admit_chat()
+    frames = _coalesce_frames(_chat_stream_generator(message, image_path, tid, payload, case_id), SSE_COALESCE_MS / 1000)
+    return _sse_response(_gated_stream(frames, slot))
 
-    return StreamingResponse(_chat_stream_generator(message, image_path, tid, payload, case_id), media_type="text/event-stream")
+
+@app.post("/chat")
+async def chat_endpoint(message: str = Form(...), image_path: Optional[str] = Form(None), thread_id: Optional[str] = Form(None), case_id: Optional[str] = Form(None), Authorization: Optional[str] = Header(None)):
+    """SSE chat endpoint compatible with the existing frontend.
+
+    The endpoint lazy-initializes the MedRAX backend if needed.
+    """
+    return await _prepare_chat(_require_auth(Authorization), message, image_path, thread_id, case_id)
 
 
 @app.get("/api/logs")
 async def get_logs(limit: int = 200):
     """Return recent diagnostic logs (most recent first)."""
-    logs = list(_RECENT_LOGS)[-limit:]
-    return {"logs": logs[::-1]}
+    n = min(max(0, limit), _log_count)
+    # Walk backwards from the newest entry in the ring
+    entries = (_RECENT_LOGS[(_log_head - 1 - i) % _LOG_CAPACITY] for i in range(n))
+    return {"logs": [f"[{ts}] {level}: {msg}" for ts, level, msg in entries]}
 
 
 @app.post("/api/mock_chat")
-async def mock_chat(message: str = Form(...), image_path: Optional[str] = Form(None)):
+async def mock_chat(message: str = Form(...), image_path: Optional[str] = Form(None), pace_ms: int = 0):
     """Mock SSE stream that simulates a realistic conversation and image updates.
 
-    Useful for frontend testing when the full backend isn't initialized.
+    Useful for frontend testing when the full backend isn't initialized. Pass
+    `?pace_ms=60` to simulate typing; by default frames are sent back to back.
     """
-    return StreamingResponse(_mock_stream_generator(message, image_path, str(time.time())), media_type="text/event-stream")
+    return _sse_response(_mock_stream_generator(message, image_path, str(time.time()), pace_ms))
+
 
+# Mock stream frames are deterministic, so they are serialized once at import time with
+# JSON placeholders that are swapped for the per-request thread id and image path.
+_MOCK_TID = b'"__MOCK_THREAD_ID__"'
+_MOCK_IMG = b'"__MOCK_IMAGE__"'
+_MOCK_DEFAULT_IMG = "/temp/mock_segmentation.png"
 
-async def _mock_stream_generator(message: str, image_path: Optional[str], thread_id: str):
+
+def _mock_frame(content: str, status: str) -> bytes:
+    payload = {"thread_id": _MOCK_TID[1:-1].decode(), "messages": [{"role": "assistant", "content": content}], "display_path": _MOCK_IMG[1:-1].decode(), "status": status, "mock": True}
+    return sse_event(payload)
+
+
+def _build_mock_token_frames() -> List[bytes]:
+    words = ("To determine if there is evidence of pleural effusion, I will first examine the uploaded chest x-ray and run a classifier. ").split()
+    return [_mock_frame(" ".join(words[:i]), "streaming") for i in range(1, len(words) + 1)]
+
+
+_MOCK_TOKEN_FRAMES = _build_mock_token_frames()
+_MOCK_TOOL_FRAME = _mock_frame("[Tool] chest_xray_classifier: probability 97%", "streaming")
+_MOCK_FINAL_FRAME = _mock_frame("Based on the classifier and visual inspection, there is high probability of pleural effusion.", "completed")
+
+
+async def _mock_stream_generator(message: str, image_path: Optional[str], thread_id: str, pace_ms: int = 0):
     """Reusable mock stream generator used by /api/mock_chat and auto-fallbacks.
     Produces SSE JSON events similar to the real agent stream.
     """
+    # sleep(0) still yields to the loop so each frame is flushed
+    pace = max(0, pace_ms) / 1000
+    tid = orjson.dumps(thread_id)
+    img = orjson.dumps(image_path or None)
+    img_or_default = orjson.dumps(image_path or _MOCK_DEFAULT_IMG)
+
     # initial partial assistant token stream
-    words = ("To determine if there is evidence of pleural effusion, I will first examine the uploaded chest x-ray and run a classifier. ").split()
-    built = ""
-    for w in words:
-        built += (w + " ")
-        payload = {"thread_id": thread_id, "messages": [{"role": "assistant", "content": built.strip()}], "display_path": image_path or None, "status": "streaming", "mock": True}
-        yield sse_event(json.dumps(payload))
-        await asyncio.sleep(0.06)
+    for frame in _MOCK_TOKEN_FRAMES:
+        yield frame.replace(_MOCK_TID, tid).replace(_MOCK_IMG, img)
+        await asyncio.sleep(pace)
 
     # simulate a tool execution event (image visualizer) that updates display_path
-    tool_payload = {"thread_id": thread_id, "messages": [{"role": "assistant", "content": "[Tool] chest_xray_classifier: probability 97%"}], "display_path": image_path or "/temp/mock_segmentation.png", "status": "streaming", "mock": True}
-    yield sse_event(json.dumps(tool_payload))
-    await asyncio.sleep(0.5)
+    yield _MOCK_TOOL_FRAME.replace(_MOCK_TID, tid).replace(_MOCK_IMG, img_or_default)
+    await asyncio.sleep(pace)
 
     # final message
-    final = {"thread_id": thread_id, "messages": [{"role": "assistant", "content": "Based on the classifier and visual inspection, there is high probability of pleural effusion."}], "display_path": image_path or "/temp/mock_segmentation.png", "status": "completed", "mock": True}
-    yield sse_event(json.dumps(final))
+    yield _MOCK_FINAL_FRAME.replace(_MOCK_TID, tid).replace(_MOCK_IMG, img_or_default)
 
 
 @app.post("/api/chat/stream")
 async def chat_stream_api(chat_msg: ChatMessage, Authorization: Optional[str] = Header(None)):
-    payload = _require_auth(Authorization)
     # alias route for compatibility with older clients
-    await initialize_medrax()
-    if initialization_error:
-        _log("WARN", "Initialization failed - falling back to mock stream for chat (api/chat/stream)")
-        return StreamingResponse(_mock_stream_generator(chat_msg.message or "", chat_msg.image_path, str(time.time())), media_type="text/event-stream")
-
-    # Persona injection
-    try:
-        persona = _persona_text(payload.get("role"))
-        if chat_msg and chat_msg.message:
-            chat_msg.message = f"{persona}\n\n" + (chat_msg.message or "")
-    except Exception:
-        pass
-
-    tid = chat_msg.thread_id or str(time.time())
-    chat_sessions.setdefault(tid, {"history": [], "created_at": time.time()})
-    try:
-        setattr(chat_interface, "current_thread_id", tid)
-    except Exception:
-        pass
-
-    return StreamingResponse(_chat_stream_generator(chat_msg.message or "", chat_msg.image_path, tid, payload, None), media_type="text/event-stream")
+    return await _prepare_chat(_require_auth(Authorization), chat_msg.message or "", chat_msg.image_path, chat_msg.thread_id)
 
 
 @app.post("/api/chat/clear")
 async def clear_chat(thread_id: str = Form(...), Authorization: Optional[str] = Header(None)):
-    _require_auth(Authorization)
+    payload = _require_auth(Authorization)
     try:
         if thread_id in chat_sessions:
             chat_sessions[thread_id]["history"] = []
@@ -730,12 +1239,9 @@ async def clear_chat(thread_id: str = Form(...), Authorization: Optional[str] =
                 chat_interface.display_file_path = None
             except Exception:
                 pass
-        # Also delete persisted thread (best-effort)
+        # Also delete persisted thread (best-effort, without holding the response)
         try:
-            payload = _require_auth(Authorization)
-            from medrax.utils.database import get_db
-            db = get_db()
-            await db["chat_threads"].delete_one({"userId": str(payload.get("sub")), "threadId": thread_id})
+            _spawn(_delete_thread_doc(_get_db(), str(payload.get("sub")), thread_id))
         except Exception:
             pass
 
@@ -744,17 +1250,40 @@ async def clear_chat(thread_id: str = Form(...), Authorization: Optional[str] =
         raise HTTPException(status_code=500, detail=f"Clear failed: {str(e)}")
 
 
+# Static part of the health payload; runtime counters are overlaid per request
+_HEALTH_STATIC: Dict[str, Any] = {"status": "healthy"}
+# (state key, body bytes, etag) of the last health response; rebuilt only when the state changes
+_health_cache: Optional[Tuple[Tuple, bytes, str]] = None
+
+
 @app.get("/api/health")
-async def health_check():
-    return {
-        "status": "healthy",
-        "agent_ready": agent is not None,
-        "tools_loaded": len(tools_dict) if tools_dict else 0,
-        "active_sessions": len(chat_sessions),
-        "initialization_error": initialization_error,
-        "initialization_error_traceback": initialization_error_tb,
-        "recent_logs_count": len(_RECENT_LOGS),
-    }
+async def health_check(if_none_match: Optional[str] = Header(None)):
+    global _health_cache
+    tools_loaded = len(tools_dict) if tools_dict else 0
+    state = (
+        agent is not None,
+        _indexes_done,
+        tools_loaded,
+        len(chat_sessions),
+        (initialization_error or {}).get("msg"),
+        _log_count,
+    )
+    if _health_cache is None or _health_cache[0] != state:
+        body = orjson.dumps({
+            **_HEALTH_STATIC,
+            "agent_ready": state[0],
+            "ready": state[0] and state[1],
+            "tools_loaded": tools_loaded,
+            "active_sessions": state[3],
+            "initialization_error": initialization_error,
+            "recent_logs_count": _log_count,
+        })
+        _health_cache = (state, body, '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"')
+    _, body, etag = _health_cache
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @app.get("/")
@@ -766,6 +1295,7 @@ async def root():
             "upload": "/upload",
             "chat": "/chat",
             "init": "/api/init",
+            "init_traceback": "/api/init/traceback",
             "health": "/api/health",
         },
     }
@@ -778,27 +1308,37 @@ async def root():
 async def list_chat_threads(limit: int = 50, Authorization: Optional[str] = Header(None)):
     payload = _require_auth(Authorization)
     try:
-        from medrax.utils.database import get_db
-        db = get_db()
-        cur = db["chat_threads"].find({"userId": str(payload.get("sub"))}).sort("updatedAt", -1).limit(max(1, min(200, limit)))
-        items = []
-        async for d in cur:
-            d["_id"] = str(d.get("_id"))
-            # Avoid returning huge histories in list view
-            d.pop("messages", None)
-            items.append(d)
-        return {"items": items}
+        db = _get_db()
+        n = max(1, min(200, limit))
+        # Project out message histories server-side so they never cross the wire in list view
+        cur = db["chat_threads"].find({"userId": str(payload.get("sub"))}, {"messages": 0}).sort("updatedAt", -1).batch_size(min(n, 50)).limit(n)
     except Exception as e:
         # If DB is unavailable, return empty list instead of failing
         return {"items": [], "error": str(e)}
+    return StreamingResponse(_stream_threads_json(cur), media_type="application/json")
+
+
+async def _stream_threads_json(cur):
+    """Emit {"items": [...]} one thread at a time straight from the Motor cursor."""
+    yield b'{"items":['
+    sep = b""
+    try:
+        async for d in cur:
+            d["_id"] = str(d.get("_id"))
+            yield sep + orjson.dumps(d, default=str)
+            sep = b","
+    except Exception as e:
+        # Headers are already sent; close the array and report the error in-band
+        yield b'],"error":' + orjson.dumps(str(e)) + b"}"
+        return
+    yield b"]}"
 
 
 @app.get("/api/chat/threads/{thread_id}")
 async def get_chat_thread(thread_id: str, Authorization: Optional[str] = Header(None)):
     payload = _require_auth(Authorization)
     try:
-        from medrax.utils.database import get_db
-        db = get_db()
+        db = _get_db()
         d = await db["chat_threads"].find_one({"userId": str(payload.get("sub")), "threadId": thread_id})
         if not d:
             raise HTTPException(status_code=404, detail="Thread not found")
@@ -814,9 +1354,7 @@ async def get_chat_thread(thread_id: str, Authorization: Optional[str] = Header(
 async def delete_chat_thread(thread_id: str, Authorization: Optional[str] = Header(None)):
     payload = _require_auth(Authorization)
     try:
-        from medrax.utils.database import get_db
-        db = get_db()
-        await db["chat_threads"].delete_one({"userId": str(payload.get("sub")), "threadId": thread_id})
+        _spawn(_delete_thread_doc(_get_db(), str(payload.get("sub")), thread_id))
         # Also clear in-memory if present
         if thread_id in chat_sessions:
             chat_sessions[thread_id]["history"] = []
@@ -16,54 +16,109 @@ Usage examples:
 """
 from __future__ import annotations
 import os
+import re
 import json
 import csv
 import time
 import argparse
-from typing import Any, Dict, List, Tuple, Set
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Set
 from pathlib import Path
 
+import numpy as np
+import orjson
+
 try:
     import ollama  # type: ignore
 except Exception:
     ollama = None  # type: ignore
 
+try:
+    import ijson  # type: ignore  # optional: streams very large qa.json arrays
+except Exception:
+    ijson = None  # type: ignore
+
+try:
+    import ahocorasick  # type: ignore  # optional: pip install pyahocorasick
+except Exception:
+    ahocorasick = None  # type: ignore
+
+import torch
+import torchxrayvision as xrv
+
 from medrax.tools.classification import ChestXRayClassifierTool
 
-def _load_json_or_jsonl(path: Path) -> Any:
+_STREAM_JSON_BYTES = 64 << 20  # stream JSON arrays larger than this with ijson (when installed)
+
+def _load_json_or_jsonl(path: Path) -> Iterator[Any]:
+    """Yield metadata rows; JSONL and large JSON arrays are streamed instead of fully parsed up front."""
     if path.suffix.lower() == ".jsonl":
-        rows = []
         with path.open("r", encoding="utf-8") as f:
             for line in f:
                 line = line.strip()
                 if not line:
                     continue
-                rows.append(json.loads(line))
-        return rows
+                yield json.loads(line)
+        return
+    if ijson is not None and path.stat().st_size > _STREAM_JSON_BYTES:
+        with path.open("rb") as f:
+            yield from ijson.items(f, "item")
+        return
     with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+        yield from json.load(f)
 
-def load_chestagentbench(metadata_path: str | Path, data_dir: str | Path) -> List[Dict[str, Any]]:
-    """Load ChestAgentBench metadata with multiple figure image paths per item."""
+_META_KEYS_RE = re.compile(rb'"images"\s*:.*?"question"\s*:|"question"\s*:.*?"images"\s*:', re.DOTALL)
+
+def _looks_like_metadata(path: Path) -> bool:
+    """Sniff a candidate file's head for the images/question schema without parsing it all."""
+    try:
+        with path.open("rb") as f:
+            if path.suffix.lower() == ".jsonl":
+                row = json.loads(f.readline() or b"null")
+                return isinstance(row, dict) and "images" in row and "question" in row
+            return _META_KEYS_RE.search(f.read(4096)) is not None
+    except (OSError, ValueError):
+        return False
+
+def _discover_metadata(data_dir: Path) -> Path:
+    """Return data_dir/qa.json, or the first JSON/JSONL file in data_dir whose head matches the schema."""
+    default = data_dir / "qa.json"
+    if default.is_file():
+        return default
+    with os.scandir(data_dir) as entries:
+        candidates = sorted(
+            Path(e.path) for e in entries
+            if e.is_file() and e.name.lower().endswith((".json", ".jsonl"))
+        )
+    for cand in candidates:
+        if _looks_like_metadata(cand):
+            return cand
+    return default
+
+def load_chestagentbench(metadata_path: str | Path, data_dir: str | Path) -> Iterator[Dict[str, Any]]:
+    """Lazily load ChestAgentBench metadata with multiple figure image paths per item."""
     p = Path(metadata_path)
-    data = _load_json_or_jsonl(p)
-    items: List[Dict[str, Any]] = []
-    for i, row in enumerate(data):
+    for i, row in enumerate(_load_json_or_jsonl(p)):
         img_paths = row.get("images", [])
         if not isinstance(img_paths, list):
             img_paths = [img_paths]
         img_paths_full = [str(Path(data_dir) / Path(p)) for p in img_paths]
-        items.append({
+        yield {
             "index": i,
             "image_paths": img_paths_full,    # We now use "figures" paths from metadata
             "question": str(row.get("question", "")).strip(),
             "answer": str(row.get("answer", "")).strip(),
             "meta": {k: v for k, v in row.items() if k not in ("images","question","answer")}
-        })
-    return items
+        }
+
+_WS_RE = re.compile(r"\s+")
+_ANSWER_PREFIX_RE = re.compile(r"^(?:answer|prediction|final):")
 
 def normalize_text(s: str) -> str:
-    return " ".join(str(s or "").strip().lower().split())
+    return _WS_RE.sub(" ", str(s or "")).strip().lower()
 
 def string_match_score(pred: str, gold: str) -> float:
     return 1.0 if normalize_text(pred) == normalize_text(gold) else 0.0
@@ -72,15 +127,12 @@ def extract_answer(text: str) -> str:
     s = normalize_text(text)
     if not s:
         return s
-    for pref in ("answer:", "prediction:", "final:"):
-        if s.startswith(pref):
-            s = s[len(pref):].strip()
-            break
-    for sep in ["\n", ". ", ".", "\r"]:
-        if sep in s:
-            s = s.split(sep, 1)[0].strip()
-            break
-    return s
+    s = _ANSWER_PREFIX_RE.sub("", s, count=1).strip()
+    # normalized text has no line breaks; cut at the first sentence end, preferring ". "
+    cut = s.find(". ")
+    if cut < 0:
+        cut = s.find(".")
+    return s[:cut].strip() if cut >= 0 else s
 
 PATHOLOGY_SYNONYMS: Dict[str, Set[str]] = {
     "effusion": {"effusion", "pleural effusion"},
@@ -95,62 +147,165 @@ PATHOLOGY_SYNONYMS: Dict[str, Set[str]] = {
     "nodule": {"nodule", "pulmonary nodule"},
 }
 
+# Every synonym (and canonical name) mapped to its canonical pathology key
+_SYNONYM_TO_KEY: Dict[str, str] = {
+    syn: k for k, syns in PATHOLOGY_SYNONYMS.items() for syn in (syns | {k})
+}
+
+def _build_synonym_automaton():
+    """Aho-Corasick automaton over all synonyms, or None if pyahocorasick is missing."""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for syn, key in _SYNONYM_TO_KEY.items():
+        automaton.add_word(syn, key)
+    automaton.make_automaton()
+    return automaton
+
+_SYNONYM_AUTOMATON = _build_synonym_automaton()
+
 def pathology_match(pred: str, gold: str) -> float:
     p = normalize_text(pred)
     g = normalize_text(gold)
     if not p or not g:
         return 0.0
-    key = None
-    for k, syns in PATHOLOGY_SYNONYMS.items():
-        if g in syns or k == g:
-            key = k
-            break
+    key = _SYNONYM_TO_KEY.get(g)
     if key:
-        for syn in PATHOLOGY_SYNONYMS[key]:
-            if syn in p:
-                return 1.0
-        return 0.0
+        if _SYNONYM_AUTOMATON is not None:
+            # one linear scan of the prediction finds every synonym it mentions
+            return 1.0 if any(hit == key for _, hit in _SYNONYM_AUTOMATON.iter(p)) else 0.0
+        return 1.0 if any(syn in p for syn in PATHOLOGY_SYNONYMS[key]) else 0.0
     return 1.0 if g in p else 0.0
 
+# Candidate labels for classifier mode (subset of the classifier's pathologies)
+LABEL_SPACE = (
+    "Effusion", "Pneumothorax", "Consolidation", "Edema", "Pneumonia",
+    "Cardiomegaly", "Atelectasis", "Fracture", "Mass", "Nodule",
+)
+
+_CLASSIFIER_LABELS = xrv.datasets.default_pathologies
+_VQA_8BIT = False  # set from --vqa-8bit before the VQA tool is first loaded
+
+@lru_cache(maxsize=2)
+def _classifier_tool(device: str) -> ChestXRayClassifierTool:
+    """Load the classifier once per device instead of once per benchmark item."""
+    return ChestXRayClassifierTool(device=device, max_batch_size=1)
+
+@lru_cache(maxsize=2)
+def _vqa_tool(device: str):
+    """Load the VQA model once per device instead of once per benchmark item."""
+    from medrax.tools.xray_vqa import XRayVQATool
+    return XRayVQATool(device=device, load_in_8bit=_VQA_8BIT)
+
+@lru_cache(maxsize=32)
+def _classifier_input(image_path: str, device: str):
+    """Decode and preprocess an image once; questions sharing an image reuse the tensor.
+
+    Entries are full-resolution float32 images, so they are kept in host memory
+    rather than pinning device memory for the whole run.
+    """
+    return _classifier_tool(device)._process_image(image_path).cpu()
+
 def run_classifier(image_path: str, question: str, device: str = "cpu") -> str:
-    tool = ChestXRayClassifierTool(device=device)
-    preds, _ = tool._run(image_path)
-    if isinstance(preds, dict) and "error" in preds:
-        return f"error: {preds['error']}"
-    label_space = [
-        "Effusion", "Pneumothorax", "Consolidation", "Edema", "Pneumonia",
-        "Cardiomegaly", "Atelectasis", "Fracture", "Mass", "Nodule"
-    ]
-    best = max(label_space, key=lambda k: float(preds.get(k, 0.0)))
-    return best
+    tool = _classifier_tool(device)
+    image = _classifier_input(image_path, device).to(device)
+    out = tool._forward(image)[0].numpy()
+    preds = dict(zip(_CLASSIFIER_LABELS, out))
+    scores = np.fromiter((preds.get(k, 0.0) for k in LABEL_SPACE), dtype=np.float32, count=len(LABEL_SPACE))
+    return LABEL_SPACE[int(scores.argmax())]
 
 def run_vqa(image_paths: List[str], question: str, device: str = "cpu", max_new_tokens: int = 256) -> str:
-    from medrax.tools.xray_vqa import XRayVQATool
-    tool = XRayVQATool(device=device)
+    tool = _vqa_tool(device)
     out, _ = tool._run(image_paths, prompt=question, max_new_tokens=max_new_tokens)
     if isinstance(out, dict) and "response" in out:
         return str(out["response"]).strip()
     return str(out)
 
+def run_vqa_batch(batch: List[Dict[str, Any]], device: str = "cpu", max_new_tokens: int = 256) -> List[str]:
+    """Answer several benchmark items with one batched VQA generate call.
+
+    If the batch cannot be answered in one call (missing or corrupt image, tokenizer
+    error, CUDA OOM, ...) it falls back to per-item predictions, so only the failing
+    items record an "error: ..." and the run carries on.
+    """
+    missing = next((p for it in batch for p in it["image_paths"] if not Path(p).is_file()), None)
+    if missing is None:
+        try:
+            tool = _vqa_tool(device)
+            return tool._generate_responses([(it["image_paths"], it["question"]) for it in batch], max_new_tokens)
+        except Exception as e:
+            print(f"Warning: batched VQA failed ({e}); answering this batch item by item")
+    else:
+        print(f"Warning: image file not found ({missing}); answering this batch item by item")
+    return [_predict_one(it, "vqa", device) for it in batch]
+
+def _predict_one(it: Dict[str, Any], mode: str, device: str) -> str:
+    img_paths = it["image_paths"]
+    q = it["question"]
+    try:
+        if mode == "classifier":
+            return run_classifier(img_paths[0], q, device=device)
+        if mode == "vqa":
+            return run_vqa(img_paths, q, device=device)
+        return run_agent_via_tools(img_paths[0], q)
+    except Exception as e:
+        return f"error: {e}"
+
+def _predict(items: Iterable[Dict[str, Any]], mode: str, device: str, batch_size: int = 1, concurrency: int = 1):
+    """Yield (item, prediction) pairs in input order.
+
+    VQA items are batched when batch_size > 1; otherwise up to `concurrency`
+    items are in flight at once on worker threads (bounded, so the lazy
+    metadata iterator is never drained ahead of the results).
+    """
+    if mode == "vqa" and batch_size > 1:
+        items = iter(items)
+        while batch := list(islice(items, batch_size)):
+            yield from zip(batch, run_vqa_batch(batch, device=device))
+        return
+    if concurrency <= 1:
+        for it in items:
+            yield it, _predict_one(it, mode, device)
+        return
+    # lru_cache does not lock while loading: build the model here, before the workers
+    # race to each construct their own copy. A failure is left for each item to report.
+    try:
+        _vqa_tool(device) if mode == "vqa" else _classifier_tool(device)
+    except Exception as e:
+        print(f"Warning: could not preload the {mode} model: {e}")
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+        window: deque = deque()
+        for it in items:
+            window.append((it, pool.submit(_predict_one, it, mode, device)))
+            if len(window) >= concurrency:
+                head, fut = window.popleft()
+                yield head, fut.result()
+        while window:
+            head, fut = window.popleft()
+            yield head, fut.result()
+
 def run_agent_via_tools(image_path: str, question: str) -> str:
     return run_classifier(image_path, question)
 
 def main():
     ap = argparse.ArgumentParser(description="Run MediVision models on ChestAgentBench and compute metrics")
     ap.add_argument("--data-dir", type=str, required=True, help="Path to chestagentbench root directory")
-    ap.add_argument("--metadata", type=str, required=False, default=None, help="Path to metadata JSON (default: data-dir/qa.json)")
+    ap.add_argument("--metadata", type=str, required=False, default=None, help="Path to metadata JSON (default: data-dir/qa.json, else first matching JSON/JSONL in data-dir)")
     ap.add_argument("--mode", type=str, choices=["classifier","vqa","agent"], default="vqa", help="Which pipeline to run")
     ap.add_argument("--limit", type=int, default=0, help="Limit number of samples (0 = all)")
     ap.add_argument("--device", type=str, default=None, help="Device override (cuda/cpu/mps)")
     ap.add_argument("--output-dir", type=str, default="./benchmark_runs", help="Directory to save results")
     ap.add_argument("--metric", type=str, choices=["exact","pathology"], default="exact", help="Scoring metric")
+    ap.add_argument("--batch-size", type=int, default=1, help="VQA items per batched generate call (vqa mode)")
+    ap.add_argument("--vqa-8bit", action="store_true", help="Load the VQA model with int8 weights (bitsandbytes, CUDA only)")
+    ap.add_argument("--concurrency", type=int, default=1, help="Items processed concurrently when not batching (overlaps image I/O with inference)")
     args = ap.parse_args()
 
     data_dir = Path(args.data_dir)
-    meta_path = Path(args.metadata) if args.metadata else data_dir / "qa.json"
+    meta_path = Path(args.metadata) if args.metadata else _discover_metadata(data_dir)
     items = load_chestagentbench(meta_path, data_dir)
     if args.limit and args.limit > 0:
-        items = items[: args.limit]
+        items = islice(items, args.limit)
     out_dir = Path(args.output_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     run_id = time.strftime("%Y%m%d_%H%M%S")
@@ -164,23 +319,19 @@ def main():
     rows: List[Dict[str, Any]] = []
 
     device = args.device if args.device else "cpu"
+    global _VQA_8BIT
+    _VQA_8BIT = args.vqa_8bit
+    # Allow TF32 matmuls for any fp32 kernels (classifier, CPU fallback paths)
+    torch.set_float32_matmul_precision("high")
 
-    with results_path.open("w", encoding="utf-8") as jf, csv_path.open("w", newline="", encoding="utf-8") as cf:
+    # 1 MiB buffers so per-row writes don't each hit the file; JSONL is written as orjson bytes
+    with results_path.open("wb", buffering=1 << 20) as jf, csv_path.open("w", newline="", encoding="utf-8", buffering=1 << 20) as cf:
         writer = csv.DictWriter(cf, fieldnames=["index","image_paths","question","gold","prediction","prediction_compact","score","score_pathology"])
         writer.writeheader()
-        for it in items:
+        for it, pred in _predict(items, args.mode, device, args.batch_size, args.concurrency):
             img_paths = it["image_paths"]
             q = it["question"]
             gold = it["answer"]
-            try:
-                if args.mode == "classifier":
-                    pred = run_classifier(img_paths[0], q, device=device)
-                elif args.mode == "vqa":
-                    pred = run_vqa(img_paths, q, device=device)
-                else:
-                    pred = run_agent_via_tools(img_paths[0], q)
-            except Exception as e:
-                pred = f"error: {e}"
             compact_pred = extract_answer(pred)
             score = string_match_score(compact_pred, gold)
             path_score = pathology_match(compact_pred, gold)
@@ -198,7 +349,7 @@ def main():
                 "score_pathology": path_score,
             }
             rows.append(rec)
-            jf.write(json.dumps(rec) + "\n")
+            jf.write(orjson.dumps(rec) + b"\n")
             writer.writerow(rec)
 
     summary = {
@@ -1,5 +1,36 @@
+import os
+import httpx
 import ollama
-from typing import List
+from functools import lru_cache
+from typing import Optional
+
+from medrax.utils import llm_cache
+
+
+@lru_cache(maxsize=None)
+def get_client(host: Optional[str] = None, max_connections: int = 16) -> ollama.Client:
+    """
+    Return a shared Ollama client for the given host.
+
+    The client keeps a pool of keep-alive connections so repeated benchmark calls
+    reuse sockets instead of reconnecting for every request.
+
+    Args:
+        host (str, optional): Ollama base URL. Defaults to $OLLAMA_BASE_URL or localhost.
+        max_connections (int, optional): Size of the connection pool. Defaults to 16.
+
+    Returns:
+        ollama.Client: Cached client instance
+    """
+    return ollama.Client(
+        host=host or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+        timeout=httpx.Timeout(120.0),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=60.0,
+        ),
+    )
 
 
 def get_llm_response(
@@ -10,6 +41,7 @@ def get_llm_response(
     temperature: float = 0.7,
     top_p: float = 0.95,
     max_tokens: int = 500,
+    keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
 ) -> str:
     """
     Get response from Ollama language model.
@@ -22,23 +54,38 @@ def get_llm_response(
         temperature (float, optional): Controls randomness in responses. Defaults to 0.7.
         top_p (float, optional): Controls diversity via nucleus sampling. Defaults to 0.95.
         max_tokens (int, optional): Max tokens in model response. Defaults to 500.
+        keep_alive (str, optional): How long Ollama keeps the model loaded after the call. Defaults to "30m".
 
     Returns:
         str: The model's response text
+
+    Deterministic calls (temperature == 0) are served from an exact-match cache
+    when the same model, messages and options were seen before.
     """
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": prompt},
     ]
+    options = {
+        "temperature": temperature,
+        "top_p": top_p,
+        "num_predict": max_tokens,
+    }
+
+    cache_key = llm_cache.make_key(model, messages, options) if temperature == 0 else None
+    if cache_key is not None:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
     response = client.chat(
         model=model,
         messages=messages,
-        options={
-            "temperature": temperature,
-            "top_p": top_p,
-            "num_predict": max_tokens,
-        }
+        options=options,
+        keep_alive=keep_alive,
     )
 
-    return response['message']['content']
\ No newline at end of file
+    content = response['message']['content']
+    if cache_key is not None:
+        llm_cache.put(cache_key, content)
+    return content
\ No newline at end of file
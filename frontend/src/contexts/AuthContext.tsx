@@ -57,6 +57,13 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
 	};
 
 	const logout = () => {
+		if (token) {
+			// Best effort: evict the token from the backend's auth cache
+			fetch(`${API_URL}/api/auth/invalidate`, {
+				method: "POST",
+				headers: { Authorization: `Bearer ${token}` },
+			}).catch(() => {});
+		}
 		localStorage.removeItem("auth.token");
 		localStorage.removeItem("auth.user");
 		setToken(null);
@@ -47,6 +47,28 @@ export const api = {
 
 export const API_URL = API_BASE;
 
+// Poll the background processing status returned by POST /upload until it settles.
+// Resolves with the final status ("ready" or "failed"), or null if it never settles.
+export async function pollUploadStatus(
+  statusUrl: string,
+  token?: string | null,
+  intervalMs = 1000,
+  maxAttempts = 120
+): Promise<{ status: string; display_path?: string; error?: string } | null> {
+  for (let i = 0; i < maxAttempts; i++) {
+    const res = await fetch(`${API_BASE}${statusUrl}`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : undefined,
+    });
+    if (res.status === 404) return null;
+    if (res.ok) {
+      const data = await res.json();
+      if (data.status !== "processing") return data;
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+  return null;
+}
+
 export function makeApi(token?: string) {
   const baseHeaders = token ? { Authorization: `Bearer ${token}` } : {};
   return {
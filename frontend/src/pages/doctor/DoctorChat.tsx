@@ -21,6 +21,7 @@ import {
   ArrowLeft
 } from "lucide-react";
 import AuthorizedImage from "@/components/AuthorizedImage";
+import { pollUploadStatus } from "@/lib/api";
 
 interface ChatMessage {
   id: string;
@@ -34,6 +35,7 @@ interface ChatMessage {
 interface UploadResponse {
   original_path: string;
   display_path: string;
+  status_url?: string;
   error?: string;
 }
 
@@ -240,6 +242,12 @@ export default function DoctorChat() {
       }
       setUploadedImage(normalize(data.display_path || null));
       setUploadedImagePath(data.original_path);
+      if (data.status_url) {
+        // DICOM conversion runs in the background; swap in the converted preview once ready
+        pollUploadStatus(data.status_url, token).then((done) => {
+          if (done?.status === "ready" && done.display_path) setUploadedImage(normalize(done.display_path));
+        });
+      }
     } catch {
       setError("Failed to upload file. Please check if the server is running.");
     } finally {
@@ -325,7 +333,8 @@ export default function DoctorChat() {
 
         for (const part of parts) {
           const line = part.trim();
-          if (!line) continue;
+          // skip empty parts and SSE comments (server keep-alive pings)
+          if (!line || line.startsWith(":")) continue;
           const dataPrefix = line.startsWith("data: ") ? line.slice(6) : line;
           try {
             const parsed = JSON.parse(dataPrefix);
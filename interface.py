@@ -1,4 +1,5 @@
 import re
+import asyncio
 import base64
 import gradio as gr
 from pathlib import Path
@@ -121,27 +122,44 @@ class ChatInterface:
         return history, gr.Textbox(value=message, interactive=False)
 
     async def process_message(
-        self, message: str, display_image: Optional[str], chat_history: List[ChatMessage]
+        self,
+        message: str,
+        display_image: Optional[str],
+        chat_history: List[ChatMessage],
+        thread_id: Optional[str] = None,
     ) -> AsyncGenerator[Tuple[List[ChatMessage], Optional[str], str], None]:
         """
         Process a message and generate responses.
 
+        The instance fields (current_thread_id, original_file_path, display_file_path)
+        hold the state of the single-user Gradio demo. Callers that share one
+        ChatInterface across concurrent requests must pass `thread_id`: the stream
+        then analyzes `display_image` only and never reads or writes those fields.
+
         Args:
             message (str): User message to process
             display_image (Optional[str]): Path to currently displayed image
             chat_history (List[ChatMessage]): Current chat history
+            thread_id (Optional[str]): Per-request conversation id (see above)
 
         Yields:
             Tuple[List[ChatMessage], Optional[str], str]: Updated chat history, display path, and empty string
         """
         chat_history = chat_history or []
 
-        # Initialize thread if needed
-        if not self.current_thread_id:
-            self.current_thread_id = str(time.time())
+        shared = thread_id is None
+        if shared:
+            # Initialize thread if needed
+            if not self.current_thread_id:
+                self.current_thread_id = str(time.time())
+            thread_id = self.current_thread_id
+            image_path = self.original_file_path or display_image
+            display_path = self.display_file_path
+        else:
+            image_path = display_image
+            display_path = None
 
         messages = []
-        image_path = self.original_file_path or display_image
 
         if image_path is not None:
             # Send path for tools
@@ -185,9 +203,15 @@ class ChatInterface:
             messages.append({"role": "user", "content": [{"type": "text", "text": message}]})
 
         try:
-            for event in self.agent.workflow.stream(
-                {"messages": messages}, {"configurable": {"thread_id": self.current_thread_id}}
-            ):
+            # The LangGraph stream is synchronous; pull each event on a worker thread so
+            # a long agent run does not block the event loop serving other requests.
+            events = iter(
+                self.agent.workflow.stream(
+                    {"messages": messages}, {"configurable": {"thread_id": thread_id}}
+                )
+            )
+            done = object()
+            while (event := await asyncio.to_thread(next, events, done)) is not done:
                 if isinstance(event, dict):
                     if "process" in event:
                         content = event["process"]["messages"][-1].content
@@ -199,7 +223,7 @@ class ChatInterface:
                             # Trim markdown headers used by some models
                             content = re.sub(r"^\s*#+\s*", "", content, flags=re.MULTILINE)
                             chat_history.append(ChatMessage(role="assistant", content=content.strip()))
-                            yield chat_history, self.display_file_path, ""
+                            yield chat_history, display_path, ""
 
                     elif "execute" in event:
                         for message in event["execute"]["messages"]:
@@ -209,18 +233,20 @@ class ChatInterface:
                             # Suppress textual tool result messages; only update images silently
                             if tool_name == "image_visualizer" and isinstance(tool_result, dict):
                                 if tool_result.get("image_path"):
-                                    self.display_file_path = tool_result["image_path"]
-                                    chat_history.append(ChatMessage(role="assistant", content={"path": self.display_file_path}))
+                                    display_path = tool_result["image_path"]
+                                    chat_history.append(ChatMessage(role="assistant", content={"path": display_path}))
 
                             elif tool_name == "chest_xray_segmentation" and isinstance(tool_result, dict):
                                 if tool_result.get("segmentation_image_path"):
                                     segmented_image_path = tool_result["segmentation_image_path"]
-                                    self.display_file_path = segmented_image_path
+                                    display_path = segmented_image_path
                                     chat_history.append(ChatMessage(role="assistant", content={"path": segmented_image_path}))
 
                             # Other tools: no direct textual emission to user; keep UI clean
 
-                            yield chat_history, self.display_file_path, ""
+                            if shared:
+                                self.display_file_path = display_path
+                            yield chat_history, display_path, ""
 
         except Exception as e:
             chat_history.append(
@@ -228,7 +254,7 @@ class ChatInterface:
                     role="assistant", content=f"❌ Error: {str(e)}", metadata={"title": "Error"}
                 )
             )
-            yield chat_history, self.display_file_path,""
+            yield chat_history, display_path, ""
 
 
 def create_demo(agent, tools_dict):
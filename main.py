@@ -1,5 +1,7 @@
 import os
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import *
 from dotenv import load_dotenv
 from transformers import logging
@@ -8,14 +10,30 @@ from langgraph.checkpoint.memory import MemorySaver
 from langchain_ollama import ChatOllama
 
 from interface import create_demo
-from medrax.agent import *
-from medrax.tools import *
-from medrax.utils import *
+import medrax.tools as medrax_tools
+from medrax.agent import Agent
+from medrax.tools import LazyTool
+from medrax.utils import load_prompts_from_file
 
 warnings.filterwarnings("ignore")
 logging.set_verbosity_error()
 _ = load_dotenv()
 
+_OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+# Cheap tools used on most requests; always built up front even with lazy_tools
+_EAGER_TOOLS = ("ImageVisualizerTool", "DicomProcessorTool")
+
+
+def filter_pulled_models(candidates, tags):
+    """Keep the candidate model names that an Ollama /api/tags response lists as pulled.
+
+    Untagged candidates (e.g. "mistral") also match their ":latest" entry.
+    """
+    pulled = {m.get("name") or m.get("model") for m in tags.get("models", [])}
+    pulled |= {n[: -len(":latest")] for n in pulled if n and n.endswith(":latest")}
+    return [m for m in candidates if m in pulled]
+
 
 def initialize_agent(
     prompt_file,
@@ -26,7 +44,8 @@ def initialize_agent(
     model="mistral:latest",  # Use Mistral for native function calling
         temperature=0.2,  # Lower temperature for more reliable tool calling
     top_p=0.95,
-    ollama_kwargs={}
+    ollama_kwargs={},
+    lazy_tools=True,
 ):
     """Initialize the MedRAX agent with specified tools and configuration.
 
@@ -40,6 +59,7 @@ def initialize_agent(
         temperature (float, optional): Temperature for the model. Defaults to 0.7.
         top_p (float, optional): Top P for the model. Defaults to 0.95.
         ollama_kwargs (dict, optional): Additional keyword arguments for Ollama API, such as base URL.
+        lazy_tools (bool, optional): Defer loading model-backed tools until their first call. Defaults to True.
 
     Returns:
         Tuple[Agent, Dict[str, BaseTool]]: Initialized agent and dictionary of tool instances
@@ -47,44 +67,67 @@ def initialize_agent(
     prompts = load_prompts_from_file(prompt_file)
     prompt = prompts["MEDICAL_ASSISTANT"]
 
+    # Constructor kwargs per tool class name (medrax.tools exports each class under that name)
     all_tools = {
-        "ChestXRayClassifierTool": lambda: ChestXRayClassifierTool(device=device),
-        "ChestXRaySegmentationTool": lambda: ChestXRaySegmentationTool(device=device),
-        "LlavaMedTool": lambda: LlavaMedTool(cache_dir=model_dir, device=device, load_in_8bit=True),
-        "XRayVQATool": lambda: XRayVQATool(cache_dir=model_dir, device=device),
-        "ChestXRayReportGeneratorTool": lambda: ChestXRayReportGeneratorTool(
-            cache_dir=model_dir, device=device
-        ),
-        "XRayPhraseGroundingTool": lambda: XRayPhraseGroundingTool(
+        "ChestXRayClassifierTool": dict(device=device),
+        "ChestXRaySegmentationTool": dict(device=device),
+        "LlavaMedTool": dict(cache_dir=model_dir, device=device, load_in_8bit=True),
+        "XRayVQATool": dict(cache_dir=model_dir, device=device),
+        "ChestXRayReportGeneratorTool": dict(cache_dir=model_dir, device=device),
+        "XRayPhraseGroundingTool": dict(
             cache_dir=model_dir, temp_dir=temp_dir, load_in_8bit=True, device=device
         ),
-        "ChestXRayGeneratorTool": lambda: ChestXRayGeneratorTool(
+        "ChestXRayGeneratorTool": dict(
             model_path=f"{model_dir}/roentgen", temp_dir=temp_dir, device=device
         ),
-        "ImageVisualizerTool": lambda: ImageVisualizerTool(),
-        "DicomProcessorTool": lambda: DicomProcessorTool(temp_dir=temp_dir),
+        "ImageVisualizerTool": dict(),
+        "DicomProcessorTool": dict(temp_dir=temp_dir),
     }
 
+    def tool_factory(tool_name):
+        # Resolving the class here means only selected tools' modules get imported;
+        # a partial (not a lambda) lets LazyTool read name/description/schema off the class
+        return partial(getattr(medrax_tools, tool_name), **all_tools[tool_name])
+
     # Initialize only selected tools or all if none specified
     tools_dict = {}
     tools_to_use = tools_to_use or all_tools.keys()
     
     print(f"\n🔧 Initializing {len(tools_to_use)} medical tools...")
-    for i, tool_name in enumerate(tools_to_use, 1):
-        if tool_name in all_tools:
-            print(f"  {i}/{len(tools_to_use)} Loading {tool_name}...")
-            tools_dict[tool_name] = all_tools[tool_name]()
-            print(f"  ✅ {tool_name} loaded successfully")
-        else:
+    for tool_name in tools_to_use:
+        if tool_name not in all_tools:
             print(f"  ❌ {tool_name} not found in available tools")
 
+    # Model-backed tools load on first call; only the cheap always-used ones are built now
+    if lazy_tools:
+        for tool_name in tools_to_use:
+            if tool_name in all_tools and tool_name not in _EAGER_TOOLS:
+                tools_dict[tool_name] = LazyTool(tool_factory(tool_name))
+                print(f"  💤 {tool_name} will load on first use")
+
+    # Tool loads are dominated by weight I/O and device transfer, so overlap them;
+    # fewer workers on CUDA to avoid VRAM spikes from concurrent loads
+    to_load = [name for name in tools_to_use if name in all_tools and name not in tools_dict]
+    max_workers = 2 if str(device).startswith("cuda") else 4
+    with ThreadPoolExecutor(max_workers=max(1, min(len(to_load), max_workers))) as pool:
+        futures = {}
+        for i, tool_name in enumerate(to_load, 1):
+            print(f"  {i}/{len(to_load)} Loading {tool_name}...")
+            futures[tool_name] = pool.submit(tool_factory(tool_name))
+        for tool_name, future in futures.items():
+            tools_dict[tool_name] = future.result()
+            print(f"  ✅ {tool_name} loaded successfully")
+
     checkpointer = MemorySaver()
     
     # Set default base_url if not provided
     if "base_url" not in ollama_kwargs:
-        ollama_kwargs["base_url"] = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+        ollama_kwargs["base_url"] = _OLLAMA_BASE_URL
     
     # Configure for NATIVE FUNCTION CALLING with Mistral (same as original MedRAX)
+    # Keep the model loaded between turns instead of Ollama's 5 minute default unload
+    ollama_kwargs.setdefault("keep_alive", os.getenv("OLLAMA_KEEP_ALIVE", "30m"))
+
     model = ChatOllama(
         model=model,  # Use the specified model
         temperature=temperature, 
@@ -117,8 +160,9 @@ if __name__ == "__main__":
     try:
         # Check if Ollama is running
         import requests
+        ollama_url = _OLLAMA_BASE_URL
         try:
-            response = requests.get("http://localhost:11434", timeout=5)
+            tags = requests.get(f"{ollama_url}/api/tags", timeout=5).json()
             print("✓ Ollama server is running")
         except Exception as e:
             print(f"✗ Ollama server not accessible: {e}")
@@ -144,6 +188,14 @@ if __name__ == "__main__":
             "mistral:latest"   # Fallback option
         ]
 
+        # Pick from the pulled models up front so tools are never loaded for a missing model
+        function_calling_models = filter_pulled_models(function_calling_models, tags)
+        if not function_calling_models:
+            print("\n❌ No compatible function-calling models found!")
+            print("Please install one of these models:")
+            print("  ollama pull qwen2.5:7b")
+            exit(1)
+
         print("Initializing MedRAX with native function calling...")
         agent = None
         
@@ -152,10 +204,7 @@ if __name__ == "__main__":
             try:
                 print(f"Attempting to use model: {model_name}")
                 
-                # Collect the ENV variables for Ollama
-                ollama_kwargs = {}
-                if base_url := os.getenv("OLLAMA_BASE_URL"):
-                    ollama_kwargs["base_url"] = base_url
+                ollama_kwargs = {"base_url": _OLLAMA_BASE_URL}
 
                 agent, tools_dict = initialize_agent(
                     "medrax/docs/system_prompts.txt",
@@ -168,6 +217,15 @@ if __name__ == "__main__":
                     ollama_kwargs=ollama_kwargs
                 )
                 print(f"✅ Successfully initialized with {model_name}")
+                # Load the model now so the first chat turn doesn't pay for it (best-effort)
+                try:
+                    requests.post(
+                        f"{ollama_url}/api/generate",
+                        json={"model": model_name, "keep_alive": os.getenv("OLLAMA_KEEP_ALIVE", "30m")},
+                        timeout=300,
+                    )
+                except Exception as e:
+                    print(f"⚠️ Could not prewarm {model_name}: {e}")
                 print(f"✅ Native function calling enabled with bind_tools()")
                 break
                 
@@ -188,11 +246,11 @@ if __name__ == "__main__":
         demo.launch(
             server_name="127.0.0.1", 
             server_port=7860, 
-            share=True,  # Set to True only if you need public access
+            share=os.getenv("MEDRAX_SHARE", "0") == "1",  # public tunnel; opt-in, it slows startup
             show_error=True,
             quiet=False,
             debug=False,
-            inbrowser=True  # Auto-open browser
+            inbrowser=os.getenv("MEDRAX_INBROWSER", "0") == "1"  # auto-open browser (dev)
         )
         
     except KeyboardInterrupt:
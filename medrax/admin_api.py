@@ -1,25 +1,41 @@
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime
 import os
-from typing import Any, Dict, Optional
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from bson import ObjectId
+import orjson
 from pymongo import ReturnDocument
 
-from medrax.utils.database import get_db
+from medrax.utils.database import SEARCH_COLLATION, get_db, transaction
 from medrax.utils.emailer import send_email
-import hashlib
+from medrax.utils.security import password_fields_async
 import secrets
 
 
 admin_router = APIRouter(prefix="/api", tags=["admin"])
 
 
+_CASE_ID_PREFIX = os.getenv("CASE_ID_PREFIX", "CX")
+
+
 def _case_id_prefix() -> str:
-    return os.getenv("CASE_ID_PREFIX", "CX")
+    return _CASE_ID_PREFIX
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().isoformat()
+
+
+# (year, "<prefix><year>") for the current UTC year; rebuilt when the year rolls over
+_YEAR_CACHE: Tuple[int, str] = (0, "")
 
 
 async def _next_case_id() -> str:
@@ -28,20 +44,85 @@ async def _next_case_id() -> str:
     Uses a counters collection with atomic $inc to avoid race conditions.
     Example: CX20250001
     """
+    global _YEAR_CACHE
     db = get_db()
-    year = datetime.utcnow().year
+    year = time.gmtime().tm_year
+    if year != _YEAR_CACHE[0]:
+        _YEAR_CACHE = (year, f"{_CASE_ID_PREFIX}{year}")
+    template = _YEAR_CACHE[1]
     counter = await db["counters"].find_one_and_update(
         {"_id": f"case_{year}"},
         {"$inc": {"seq": 1}},
         upsert=True,
         return_document=ReturnDocument.AFTER,
+        projection={"_id": 0, "seq": 1},
     )
     seq = counter.get("seq", 1)
-    return f"{_case_id_prefix()}{year}{seq:04d}"
+    return f"{template}{seq:04d}"
+
+
+# Caps concurrent SMTP sessions opened by background sends
+_EMAIL_SEMAPHORE = asyncio.Semaphore(int(os.getenv("SMTP_MAX_CONCURRENCY", "16")))
+# Strong refs so queued sends are not garbage-collected mid-flight
+_EMAIL_TASKS: set = set()
+
+
+async def _send_email_task(kwargs: Dict[str, Any]) -> None:
+    async with _EMAIL_SEMAPHORE:
+        try:
+            await asyncio.to_thread(send_email, **kwargs)
+        except Exception as e:
+            print(f"[EMAIL:ERROR] Background send to {kwargs.get('to')} failed: {e}")
+
+
+def _send_email_bg(**kwargs: Any) -> None:
+    """Queue send_email on a worker thread so SMTP never blocks the response."""
+    task = asyncio.create_task(_send_email_task(kwargs))
+    _EMAIL_TASKS.add(task)
+    task.add_done_callback(_EMAIL_TASKS.discard)
+
+
+# Aggregation-pipeline update that flips `active` server-side (missing counts as active)
+_TOGGLE_ACTIVE = [{"$set": {"active": {"$not": [{"$ifNull": ["$active", True]}]}}}]
+
+
+_OID_RE = re.compile(r"[0-9a-fA-F]{24}")
+
+
+_CASE_ID_QUERY_RE = re.compile(rf"{re.escape(_CASE_ID_PREFIX)}\d*", re.IGNORECASE)
+
+
+def _prefix_filter(q: str, fields: List[str]) -> Dict[str, Any]:
+    """Match documents where any of `fields` starts with `q`, ignoring case.
+
+    Run the query with ``collation=SEARCH_COLLATION``: the prefix is expressed as a
+    string range (U+FFFF sorts after every character in ICU collation) rather than
+    a case-insensitive regex, so each $or branch seeks that field's *_search index.
+    """
+    bounds = {"$gte": q, "$lt": q + "\uffff"}
+    return {"$or": [{field: bounds} for field in fields]}
+
+
+async def _search_filter(
+    coll, base: Dict[str, Any], q: str, prefix_fields: List[str], substring_fields: List[str]
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Return (filter, collation) for an admin search box query.
+
+    The indexed prefix match is used whenever it has any hit. Otherwise (a surname,
+    the middle of a phone number, a case id fragment, ...) fall back to an escaped,
+    case-insensitive substring $regex on `substring_fields`; that scans, but only
+    for searches the indexes cannot answer, and the caller's limit still applies.
+    """
+    prefix = {**base, **_prefix_filter(q, prefix_fields)}
+    if await coll.find_one(prefix, {"_id": 1}, collation=SEARCH_COLLATION) is not None:
+        return prefix, SEARCH_COLLATION
+    pattern = {"$regex": re.escape(q), "$options": "i"}
+    return {**base, "$or": [{field: pattern} for field in substring_fields]}, None
 
 
 def _oid(id_str: str) -> ObjectId:
-    if not ObjectId.is_valid(id_str):
+    # One regex check, then a single ObjectId parse (is_valid would parse it twice)
+    if not isinstance(id_str, str) or not _OID_RE.fullmatch(id_str):
         raise HTTPException(status_code=400, detail="Invalid id")
     return ObjectId(id_str)
 
@@ -83,12 +164,14 @@ ALLOWED_STATUSES = {
 
 # ===== Cases =====
 
+_STAT_STATUSES = ("awaiting_scan", "scan_uploaded", "analysis_complete", "archived")
+
 
 @admin_router.post("/cases")
 async def create_case(payload: CreateCasePayload):
     db = get_db()
     cid = await _next_case_id()
-    now = datetime.utcnow().isoformat()
+    now = _now_iso()
     doc: Dict[str, Any] = {
         "caseId": cid,
         "patient": payload.patient.dict(),
@@ -119,7 +202,7 @@ async def create_case(payload: CreateCasePayload):
             app_base = os.getenv("APP_BASE_URL", "http://localhost:5173")
             patient_url = f"{app_base}/patient-login?caseId={cid}"
             if patient.get("email"):
-                send_email(
+                _send_email_bg(
                     to=patient["email"],
                     subject=f"Your Case ID: {cid}",
                     text=(
@@ -136,6 +219,31 @@ async def create_case(payload: CreateCasePayload):
     return {"ok": True, "caseId": cid}
 
 
+async def _cases_cursor(status: Optional[str], doctorId: Optional[str], q: Optional[str], skip: int, limit: int):
+    """Build the filtered, newest-first cases cursor shared by the list endpoints."""
+    db = get_db()
+    filt: Dict[str, Any] = {}
+    collation = None
+    if status:
+        filt["status"] = status
+    if doctorId:
+        filt["assignedDoctorId"] = doctorId
+    q = (q or "").strip()
+    if q:
+        if _CASE_ID_QUERY_RE.fullmatch(q):
+            # case ids are uppercase prefix+digits: a case-sensitive anchored regex seeks the caseId index
+            filt["caseId"] = {"$regex": "^" + re.escape(q.upper())}
+        else:
+            filt, collation = await _search_filter(
+                db["cases"],
+                filt,
+                q,
+                ["patient.name", "patient.email", "patient.phone"],
+                ["patient.name", "patient.email", "patient.phone", "caseId"],
+            )
+    return db["cases"].find(filt, collation=collation).skip(max(0, skip)).limit(limit).sort("updatedAt", -1)
+
+
 @admin_router.get("/cases")
 async def list_cases(
     status: Optional[str] = Query(default=None),
@@ -144,27 +252,49 @@ async def list_cases(
     skip: int = 0,
     limit: int = 50,
 ):
-    db = get_db()
-    filt: Dict[str, Any] = {}
-    if status:
-        filt["status"] = status
-    if doctorId:
-        filt["assignedDoctorId"] = doctorId
-    if q:
-        # simple OR search on patient fields
-        filt["$or"] = [
-            {"patient.name": {"$regex": q, "$options": "i"}},
-            {"patient.phone": {"$regex": q, "$options": "i"}},
-            {"patient.email": {"$regex": q, "$options": "i"}},
-            {"caseId": {"$regex": q, "$options": "i"}},
-        ]
-    cursor = db["cases"].find(filt).skip(max(0, skip)).limit(min(200, max(1, limit))).sort("updatedAt", -1)
-    items = [
-        {**c, "_id": str(c.get("_id"))} async for c in cursor
-    ]
+    limit = min(200, max(1, limit))
+    cursor = await _cases_cursor(status, doctorId, q, skip, limit)
+    items = await cursor.to_list(length=limit)
+    for c in items:
+        c["_id"] = str(c["_id"])
     return {"items": items}
 
 
+@admin_router.get("/cases.ndjson")
+async def list_cases_ndjson(
+    status: Optional[str] = Query(default=None),
+    doctorId: Optional[str] = Query(default=None),
+    q: Optional[str] = Query(default=None),
+    skip: int = 0,
+    limit: int = 50,
+):
+    """Same rows as /cases, streamed one JSON document per line as the cursor yields them."""
+    cursor = await _cases_cursor(status, doctorId, q, skip, min(200, max(1, limit)))
+
+    async def _rows():
+        async for c in cursor:
+            c["_id"] = str(c["_id"])
+            # default=str: ObjectId refs / Decimal128 must not abort the stream after the 200 is sent
+            yield orjson.dumps(c, default=str) + b"\n"
+
+    return StreamingResponse(_rows(), media_type="application/x-ndjson")
+
+
+# Registered before /cases/{caseId} so "stats" isn't captured as a case id
+@admin_router.get("/cases/stats")
+async def case_stats():
+    """Return simple counts per status for dashboard counters."""
+    db = get_db()
+    counts: Dict[str, int] = dict.fromkeys(_STAT_STATUSES, 0)
+    total = 0
+    # One $group round-trip instead of a count_documents per status plus the total
+    async for row in db["cases"].aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}]):
+        total += row["n"]
+        if row["_id"] in counts:
+            counts[row["_id"]] = row["n"]
+    return {"total": total, **counts}
+
+
 @admin_router.get("/cases/{caseId}")
 async def get_case(caseId: str):
     db = get_db()
@@ -175,18 +305,6 @@ async def get_case(caseId: str):
     return c
 
 
-@admin_router.get("/cases/stats")
-async def case_stats():
-    """Return simple counts per status for dashboard counters."""
-    db = get_db()
-    statuses = ["awaiting_scan", "scan_uploaded", "analysis_complete", "archived"]
-    counts: Dict[str, int] = {}
-    for s in statuses:
-        counts[s] = await db["cases"].count_documents({"status": s})
-    total = await db["cases"].count_documents({})
-    return {"total": total, **counts}
-
-
 @admin_router.patch("/cases/{caseId}/assign")
 async def assign_case(caseId: str, payload: AssignPayload):
     db = get_db()
@@ -197,7 +315,7 @@ async def assign_case(caseId: str, payload: AssignPayload):
         updates["assignedLabTechId"] = payload.assignedLabTechId
     if not updates:
         raise HTTPException(status_code=400, detail="Nothing to update")
-    updates["updatedAt"] = datetime.utcnow().isoformat()
+    updates["updatedAt"] = _now_iso()
     res = await db["cases"].update_one({"caseId": caseId}, {"$set": updates})
     if res.matched_count == 0:
         raise HTTPException(status_code=404, detail="Case not found")
@@ -211,7 +329,7 @@ async def update_case_status(caseId: str, payload: StatusPayload):
     db = get_db()
     res = await db["cases"].update_one(
         {"caseId": caseId},
-        {"$set": {"status": payload.status, "updatedAt": datetime.utcnow().isoformat()}},
+        {"$set": {"status": payload.status, "updatedAt": _now_iso()}},
     )
     if res.matched_count == 0:
         raise HTTPException(status_code=404, detail="Case not found")
@@ -223,14 +341,14 @@ async def archive_case(caseId: str):
     db = get_db()
     res = await db["cases"].update_one(
         {"caseId": caseId},
-        {"$set": {"status": "archived", "updatedAt": datetime.utcnow().isoformat()}},
+        {"$set": {"status": "archived", "updatedAt": _now_iso()}},
     )
     if res.matched_count == 0:
         raise HTTPException(status_code=404, detail="Case not found")
     return {"ok": True}
 
 
-@admin_router.post("/cases/{caseId}/resend")
+@admin_router.post("/cases/{caseId}/resend", status_code=202)
 async def resend_instructions(caseId: str):
     db = get_db()
     case = await db["cases"].find_one({"caseId": caseId})
@@ -241,23 +359,19 @@ async def resend_instructions(caseId: str):
     app_base = os.getenv("APP_BASE_URL", "http://localhost:5173")
     patient_url = f"{app_base}/patient-login?caseId={caseId}"
 
-    sent = False
     if email:
-        try:
-            sent = send_email(
-                to=email,
-                subject=f"Your Case ID: {caseId}",
-                text=(
-                    f"Hello {patient.get('name','')},\n\n"
-                    f"Here is your case link. Case ID: {caseId}.\n"
-                    f"Access your case here: {patient_url}\n\n"
-                    f"— MediVision"
-                ),
-            ) or False
-        except Exception:
-            sent = False
+        _send_email_bg(
+            to=email,
+            subject=f"Your Case ID: {caseId}",
+            text=(
+                f"Hello {patient.get('name','')},\n\n"
+                f"Here is your case link. Case ID: {caseId}.\n"
+                f"Access your case here: {patient_url}\n\n"
+                f"— MediVision"
+            ),
+        )
 
-    return {"ok": True, "sent": bool(sent), "caseId": caseId, "email": email or ""}
+    return {"ok": True, "queued": bool(email), "caseId": caseId, "email": email or ""}
 
 
 # ===== Doctors =====
@@ -276,43 +390,47 @@ async def add_doctor(payload: CreateDoctorPayload):
     # basic validation
     if not payload.password or len(payload.password) < 6:
         raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
+    now = _now_iso()
     doc = {
         "name": payload.name,
         "email": payload.email,
         "passwordPlain": payload.password,  # stored to allow 'Send Credentials' later per requirements
         "specialty": payload.specialty,
         "active": True,
-        "createdAt": datetime.utcnow().isoformat(),
+        "createdAt": now,
     }
-    res = await db["doctors"].insert_one(doc)
-
-    # Create or update user credential with provided password
-    try:
-        pw_hash = hashlib.sha256(payload.password.encode()).hexdigest()
-        await db["users"].update_one(
-            {"email": payload.email},
-            {"$set": {"email": payload.email, "role": "doctor", "passwordHash": pw_hash, "active": True, "updatedAt": datetime.utcnow().isoformat()},
-             "$setOnInsert": {"createdAt": datetime.utcnow().isoformat()}},
-            upsert=True,
-        )
+    pw_fields = await password_fields_async(payload.password)
+    # Doctor profile and login credential are written together or not at all: inside a
+    # transaction on replica sets; standalone servers have none, so the insert is undone by hand
+    async with transaction() as session:
+        res = await db["doctors"].insert_one(doc, session=session)
+        try:
+            await db["users"].update_one(
+                {"email": payload.email},
+                {"$set": {"email": payload.email, "role": "doctor", **pw_fields, "active": True, "updatedAt": now},
+                 "$setOnInsert": {"createdAt": now}},
+                upsert=True,
+                session=session,
+            )
+        except Exception:
+            if session is None:
+                await db["doctors"].delete_one({"_id": res.inserted_id})
+            raise
 
-        app_base = os.getenv("APP_BASE_URL", "http://localhost:5173")
-        dashboard_url = f"{app_base}/doctor-dashboard"
-        send_email(
-            to=payload.email,
-            subject="Your MediVision Doctor Account",
-            text=(
-                f"Hello {payload.name},\n\n"
-                f"An account has been created for you on MediVision.\n"
-                f"Role: Doctor\n"
-                f"Password: {payload.password}\n"
-                f"Login/Dashboard: {dashboard_url}\n\n"
-                f"Please change your password after first login.\n\n— MediVision"
-            ),
-        )
-    except Exception as _e:
-        # Soft-fail email/user creation; admin can resend later
-        pass
+    app_base = os.getenv("APP_BASE_URL", "http://localhost:5173")
+    dashboard_url = f"{app_base}/doctor-dashboard"
+    _send_email_bg(
+        to=payload.email,
+        subject="Your MediVision Doctor Account",
+        text=(
+            f"Hello {payload.name},\n\n"
+            f"An account has been created for you on MediVision.\n"
+            f"Role: Doctor\n"
+            f"Password: {payload.password}\n"
+            f"Login/Dashboard: {dashboard_url}\n\n"
+            f"Please change your password after first login.\n\n— MediVision"
+        ),
+    )
 
     return {"ok": True, "id": str(res.inserted_id)}
 
@@ -320,25 +438,29 @@ async def add_doctor(payload: CreateDoctorPayload):
 @admin_router.get("/doctors")
 async def list_doctors():
     db = get_db()
-    items = [
-        {**d, "_id": str(d.get("_id"))} async for d in db["doctors"].find({}).sort("name", 1)
-    ]
+    # passwordPlain is only read by send_doctor_credentials; never ship it to the list view
+    items = await db["doctors"].find({}, {"passwordPlain": 0}).sort("name", 1).to_list(length=None)
+    for d in items:
+        d["_id"] = str(d["_id"])
     return {"items": items}
 
 
 @admin_router.patch("/doctors/{id}/toggle")
 async def toggle_doctor(id: str):
     db = get_db()
-    doc = await db["doctors"].find_one({"_id": _oid(id)})
+    doc = await db["doctors"].find_one_and_update(
+        {"_id": _oid(id)},
+        _TOGGLE_ACTIVE,
+        return_document=ReturnDocument.AFTER,
+        projection={"_id": 0, "active": 1, "email": 1},
+    )
     if not doc:
         raise HTTPException(status_code=404, detail="Doctor not found")
-    new_active = not bool(doc.get("active", True))
-    # Toggle active flag on doctors collection
-    await db["doctors"].update_one({"_id": _oid(id)}, {"$set": {"active": new_active}})
+    new_active = doc["active"]
     # Also reflect this on the corresponding user to affect login ability
     await db["users"].update_one(
         {"email": doc.get("email")},
-        {"$set": {"active": new_active, "updatedAt": datetime.utcnow().isoformat()}},
+        {"$set": {"active": new_active, "updatedAt": _now_iso()}},
     )
     return {"ok": True, "active": new_active}
 
@@ -352,17 +474,18 @@ async def resend_doctor_credentials(id: str):
         raise HTTPException(status_code=404, detail="Doctor not found")
 
     temp_pw = secrets.token_urlsafe(10)
-    pw_hash = hashlib.sha256(temp_pw.encode()).hexdigest()
+    pw_fields = await password_fields_async(temp_pw)
+    now = _now_iso()
     await db["users"].update_one(
         {"email": doc.get("email")},
-        {"$set": {"email": doc.get("email"), "role": "doctor", "passwordHash": pw_hash, "active": True, "updatedAt": datetime.utcnow().isoformat()},
-         "$setOnInsert": {"createdAt": datetime.utcnow().isoformat()}},
+        {"$set": {"email": doc.get("email"), "role": "doctor", **pw_fields, "active": True, "updatedAt": now},
+         "$setOnInsert": {"createdAt": now}},
         upsert=True,
     )
 
     app_base = os.getenv("APP_BASE_URL", "http://localhost:5173")
     dashboard_url = f"{app_base}/doctor-dashboard"
-    send_email(
+    _send_email_bg(
         to=doc.get("email"),
         subject="Your MediVision Doctor Credentials",
         text=(
@@ -395,7 +518,7 @@ async def send_doctor_credentials(id: str):
 
     app_base = os.getenv("APP_BASE_URL", "http://localhost:5173")
     dashboard_url = f"{app_base}/doctor-dashboard"
-    send_email(
+    _send_email_bg(
         to=email,
         subject="Your MediVision Doctor Credentials",
         text=(
@@ -427,7 +550,7 @@ async def add_labtech(payload: CreateLabTechPayload):
         "email": payload.email,
         "labId": payload.labId,
         "active": True,
-        "createdAt": datetime.utcnow().isoformat(),
+        "createdAt": _now_iso(),
     }
     res = await db["labtechs"].insert_one(doc)
     return {"ok": True, "id": str(res.inserted_id)}
@@ -436,21 +559,24 @@ async def add_labtech(payload: CreateLabTechPayload):
 @admin_router.get("/labtechs")
 async def list_labtechs():
     db = get_db()
-    items = [
-        {**t, "_id": str(t.get("_id"))} async for t in db["labtechs"].find({}).sort("name", 1)
-    ]
+    items = await db["labtechs"].find({}).sort("name", 1).to_list(length=None)
+    for t in items:
+        t["_id"] = str(t["_id"])
     return {"items": items}
 
 
 @admin_router.patch("/labtechs/{id}/toggle")
 async def toggle_labtech(id: str):
     db = get_db()
-    doc = await db["labtechs"].find_one({"_id": _oid(id)})
+    doc = await db["labtechs"].find_one_and_update(
+        {"_id": _oid(id)},
+        _TOGGLE_ACTIVE,
+        return_document=ReturnDocument.AFTER,
+        projection={"_id": 0, "active": 1},
+    )
     if not doc:
         raise HTTPException(status_code=404, detail="Lab tech not found")
-    new_active = not bool(doc.get("active", True))
-    await db["labtechs"].update_one({"_id": _oid(id)}, {"$set": {"active": new_active}})
-    return {"ok": True, "active": new_active}
+    return {"ok": True, "active": doc["active"]}
 
 
 # ===== Patients =====
@@ -460,15 +586,16 @@ async def toggle_labtech(id: str):
 async def search_patients(q: Optional[str] = None, limit: int = 50):
     db = get_db()
     filt: Dict[str, Any] = {}
+    collation: Optional[Dict[str, Any]] = SEARCH_COLLATION
+    q = (q or "").strip()
     if q:
-        filt["$or"] = [
-            {"name": {"$regex": q, "$options": "i"}},
-            {"email": {"$regex": q, "$options": "i"}},
-            {"phone": {"$regex": q, "$options": "i"}},
-        ]
-    items = [
-        {**p, "_id": str(p.get("_id"))} async for p in db["patients"].find(filt).limit(min(200, max(1, limit))).sort("name", 1)
-    ]
+        fields = ["name", "email", "phone"]
+        filt, collation = await _search_filter(db["patients"], filt, q, fields, fields)
+    limit = min(200, max(1, limit))
+    cursor = db["patients"].find(filt, collation=collation)
+    items = await cursor.limit(limit).sort("name", 1).to_list(length=limit)
+    for p in items:
+        p["_id"] = str(p["_id"])
     return {"items": items}
 
 
@@ -1,5 +1,7 @@
 import json
 import operator
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime
@@ -12,6 +14,11 @@ from langchain_core.tools import BaseTool
 
 _ = load_dotenv()
 
+# Shared by every agent turn instead of building a pool per execute_tools call
+_TOOL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TOOL_WORKERS", "8")), thread_name_prefix="agent-tool"
+)
+
 
 class ToolCallLog(TypedDict):
     """
@@ -147,9 +154,6 @@ class Agent:
         Returns:
             Dict[str, List[ToolMessage]]: A dictionary containing tool execution results.
         """
-        import concurrent.futures
-        import threading
-        
         tool_calls = state["messages"][-1].tool_calls
         results = []
 
@@ -183,13 +187,11 @@ class Agent:
                         content=f"Tool execution failed: {str(e)}",
                     )
 
-        # Execute tools in parallel for research-grade performance
+        # Execute tools in parallel for research-grade performance; map keeps the
+        # ToolMessages in tool_call order, and the pool is shared across turns
         if len(tool_calls) > 1:
             print(f"🚀 PARALLEL EXECUTION: Running {len(tool_calls)} tools simultaneously")
-            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(tool_calls), 4)) as executor:
-                future_to_call = {executor.submit(execute_single_tool, call): call for call in tool_calls}
-                for future in concurrent.futures.as_completed(future_to_call):
-                    results.append(future.result())
+            results = list(_TOOL_EXECUTOR.map(execute_single_tool, tool_calls))
         else:
             # Single tool execution
             results = [execute_single_tool(tool_calls[0])]
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import os
-import hashlib
 from datetime import datetime
 from typing import Optional
 
@@ -10,15 +9,12 @@ from pydantic import BaseModel
 
 from medrax.utils.database import get_db
 from medrax.utils.jwt import create_jwt, verify_jwt
+from medrax.utils.security import needs_rehash, password_fields_async, verify_password_async
 
 
 auth_router = APIRouter(prefix="/api/auth", tags=["auth"])
 
 
-def _hash_password(pw: str) -> str:
-    return hashlib.sha256(pw.encode()).hexdigest()
-
-
 def _jwt_secret() -> str:
     return os.getenv("JWT_SECRET", "dev-secret-change-me")
 
@@ -43,8 +39,14 @@ async def login(payload: LoginPayload):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     if not user.get("active", True):
         raise HTTPException(status_code=403, detail="Account inactive")
-    if user.get("passwordHash") != _hash_password(payload.password):
+    if not await verify_password_async(payload.password, user):
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if needs_rehash(user):
+        # Upgrade legacy SHA-256 hashes now that we hold the plaintext
+        await db["users"].update_one(
+            {"_id": user["_id"]},
+            {"$set": await password_fields_async(payload.password)},
+        )
 
     token = create_jwt({
         "sub": str(user.get("_id")),
@@ -82,7 +84,7 @@ async def signup(payload: SignupPayload):
         "email": payload.email,
         "name": payload.name,
         "role": "user",  # general user
-        "passwordHash": _hash_password(payload.password),
+        **await password_fields_async(payload.password),
         "active": True,
         "organization": payload.organization,
         "createdAt": datetime.utcnow().isoformat(),
@@ -107,14 +109,14 @@ class SeedPayload(BaseModel):
 @auth_router.post("/debug_seed_admin")
 async def debug_seed_admin(payload: SeedPayload):
     db = get_db()
-    pw_hash = _hash_password(payload.password)
+    pw_fields = await password_fields_async(payload.password)
     await db["users"].update_one(
         {"email": payload.email},
         {"$set": {
             "email": payload.email,
             "name": payload.name,
             "role": "admin",
-            "passwordHash": pw_hash,
+            **pw_fields,
             "active": True,
             "updatedAt": datetime.utcnow().isoformat(),
         }, "$setOnInsert": {"createdAt": datetime.utcnow().isoformat()}},
@@ -137,14 +139,14 @@ async def debug_set_password(payload: DebugSetPasswordPayload):
     Creates the user if missing with the given role.
     """
     db = get_db()
-    pw_hash = _hash_password(payload.password)
+    pw_fields = await password_fields_async(payload.password)
     await db["users"].update_one(
         {"email": payload.email},
         {"$set": {
             "email": payload.email,
             "name": payload.name or payload.email,
             "role": payload.role or "doctor",
-            "passwordHash": pw_hash,
+            **pw_fields,
             "active": True,
             "updatedAt": datetime.utcnow().isoformat(),
         }, "$setOnInsert": {"createdAt": datetime.utcnow().isoformat()}},
@@ -181,10 +183,10 @@ async def change_password(payload: ChangePasswordPayload, Authorization: Optiona
     user = await db["users"].find_one({"email": auth.get("email")})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if user.get("passwordHash") != _hash_password(payload.oldPassword):
+    if not await verify_password_async(payload.oldPassword, user):
         raise HTTPException(status_code=401, detail="Old password incorrect")
     await db["users"].update_one(
         {"_id": user.get("_id")},
-        {"$set": {"passwordHash": _hash_password(payload.newPassword), "updatedAt": datetime.utcnow().isoformat()}},
+        {"$set": {**await password_fields_async(payload.newPassword), "updatedAt": datetime.utcnow().isoformat()}},
     )
     return {"ok": True}
@@ -10,6 +10,7 @@ from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException
 from fastapi.responses import StreamingResponse, JSONResponse, Response
 from motor.motor_asyncio import AsyncIOMotorGridFSBucket
 from bson import ObjectId
+import aiofiles
 
 from medrax.utils.database import get_db
 from medrax.utils.jwt import verify_jwt
@@ -50,15 +51,24 @@ async def attach_image_to_case(caseId: str, store: str = Form("fs"), modality: O
         raise HTTPException(status_code=404, detail="Case not found")
 
     # Lazy import from api to avoid circular import at module load time
-    from api import upload_dir, initialize_medrax, chat_interface, initialization_error
+    from api import upload_dir, initialize_medrax, chat_interface, initialization_error, _UPLOAD_CHUNK_SIZE, MAX_UPLOAD_BYTES
 
     # Save to disk
     timestamp = int(time.time())
     ext = Path(file.filename or "").suffix
     saved_filename = f"case_{caseId}_{timestamp}{ext}"
     file_path = upload_dir / saved_filename
-    content = await file.read()
-    file_path.write_bytes(content)
+    # Stream to disk in chunks so large DICOMs never sit fully in memory
+    total = 0
+    async with aiofiles.open(file_path, "wb") as out:
+        while chunk := await file.read(_UPLOAD_CHUNK_SIZE):
+            total += len(chunk)
+            if total > MAX_UPLOAD_BYTES:
+                break
+            await out.write(chunk)
+    if total > MAX_UPLOAD_BYTES:
+        file_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=413, detail="Uploaded file is too large")
 
     # Try to detect modality if not provided and DICOM
     if not modality:
@@ -86,7 +96,8 @@ async def attach_image_to_case(caseId: str, store: str = Form("fs"), modality: O
     grid_id = None
     if store.lower() == "gridfs":
         bucket = await _grid_bucket()
-        grid_id = await bucket.upload_from_stream(file.filename or saved_filename, content)
+        with open(file_path, "rb") as src:
+            grid_id = await bucket.upload_from_stream(file.filename or saved_filename, src)
 
     entry = {
         "_id": str(ObjectId()),
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import os
+import uuid
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 
@@ -302,7 +303,9 @@ async def analyze_case(caseId: str, payload: Optional[AnalyzeRequest] = None, Au
         history = []
         final_text = ""
         display = None
-        async for updated_history, display_path, _ in chat_interface.process_message(context, img_path, history):
+        # A private thread id keeps this run off the shared interface state and other chats
+        analysis_tid = f"analysis_{caseId}_{uuid.uuid4().hex}"
+        async for updated_history, display_path, _ in chat_interface.process_message(context, img_path, history, thread_id=analysis_tid):
             history = updated_history
             display = display_path or display
         # pick last assistant message
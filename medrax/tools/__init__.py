@@ -1,11 +1,44 @@
-"""Tools for the Medical Agent."""
-
-from .classification import *
-from .report_generation import *
-from .segmentation import *
-from .xray_vqa import *
-from .llava_med import *
-from .grounding import *
-from .generation import *
-from .dicom import *
-from .utils import *
+"""Tools for the Medical Agent.
+
+Tool classes are imported from their submodule on first access, so importing the
+package (or one tool) does not pull in every model framework up front.
+"""
+
+import importlib
+
+_EXPORTS = {
+    "ChestXRayInput": ".classification",
+    "ChestXRayClassifierTool": ".classification",
+    "ChestXRayReportGeneratorTool": ".report_generation",
+    "ChestXRaySegmentationInput": ".segmentation",
+    "OrganMetrics": ".segmentation",
+    "ChestXRaySegmentationTool": ".segmentation",
+    "XRayVQAToolInput": ".xray_vqa",
+    "XRayVQATool": ".xray_vqa",
+    "LlavaMedInput": ".llava_med",
+    "LlavaMedTool": ".llava_med",
+    "XRayPhraseGroundingInput": ".grounding",
+    "XRayPhraseGroundingTool": ".grounding",
+    "ChestXRayGeneratorInput": ".generation",
+    "ChestXRayGeneratorTool": ".generation",
+    "DicomProcessorInput": ".dicom",
+    "DicomProcessorTool": ".dicom",
+    "ImageVisualizerInput": ".utils",
+    "ImageVisualizerTool": ".utils",
+    "LazyTool": ".lazy",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,4 +1,8 @@
-from typing import Dict, Optional, Tuple, Type
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
 from pydantic import BaseModel, Field
 
 import skimage.io
@@ -21,6 +25,59 @@ class ChestXRayInput(BaseModel):
     )
 
 
+class _BatchScheduler:
+    """Coalesces concurrent single-image forward passes into batched model calls.
+
+    Tool calls run on the agent's worker threads, so each caller submits its
+    preprocessed tensor and blocks on a Future while one background thread collects
+    up to `max_batch_size` requests within `max_wait` seconds, stacks same-shaped
+    tensors into a single `[B, C, H, W]` batch and scatters the rows back.
+    """
+
+    def __init__(self, forward: Callable[[torch.Tensor], torch.Tensor], max_batch_size: int, max_wait: float):
+        self._forward = forward
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[torch.Tensor, Future]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._loop, name="xray-classifier-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, img: torch.Tensor) -> Future:
+        fut: Future = Future()
+        self._queue.put((img, fut))
+        return fut
+
+    def _collect(self) -> List[Tuple[torch.Tensor, Future]]:
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self._max_wait
+        while len(items) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _loop(self) -> None:
+        while True:
+            items = self._collect()
+            # Images are center-cropped but not resized, so only equal shapes can share a batch
+            groups: Dict[Tuple[int, ...], List[Tuple[torch.Tensor, Future]]] = {}
+            for img, fut in items:
+                groups.setdefault(tuple(img.shape), []).append((img, fut))
+            for group in groups.values():
+                try:
+                    out = self._forward(torch.cat([img for img, _ in group]))
+                except Exception as e:
+                    for _, fut in group:
+                        fut.set_exception(e)
+                    continue
+                for i, (_, fut) in enumerate(group):
+                    fut.set_result(out[i])
+
+
 class ChestXRayClassifierTool(BaseTool):
     """Tool that classifies chest X-ray images for multiple pathologies.
 
@@ -49,8 +106,15 @@ class ChestXRayClassifierTool(BaseTool):
     model: xrv.models.DenseNet = None
     device: Optional[str] = "cpu"
     transform: torchvision.transforms.Compose = None
+    batcher: Optional[Any] = None
 
-    def __init__(self, model_name: str = "densenet121-res224-all", device: Optional[str] = None):
+    def __init__(
+        self,
+        model_name: str = "densenet121-res224-all",
+        device: Optional[str] = None,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 20.0,
+    ):
         super().__init__()
         
         # Auto-detect device if not specified
@@ -74,6 +138,15 @@ class ChestXRayClassifierTool(BaseTool):
         
         self.transform = torchvision.transforms.Compose([xrv.datasets.XRayCenterCrop()])
 
+        # Batch concurrent requests (e.g. several chat sessions) into one forward pass
+        if max_batch_size > 1:
+            self.batcher = _BatchScheduler(self._forward, max_batch_size, max_wait_ms / 1000)
+
+    def _forward(self, batch: torch.Tensor) -> torch.Tensor:
+        """Run the model on a batch of processed images and return per-image predictions on CPU."""
+        with torch.inference_mode():
+            return self.model(batch).cpu()
+
     def _process_image(self, image_path: str) -> torch.Tensor:
         """
         Process the input chest X-ray image for model inference.
@@ -127,8 +200,10 @@ class ChestXRayClassifierTool(BaseTool):
         try:
             img = self._process_image(image_path)
 
-            with torch.inference_mode():
-                preds = self.model(img).cpu()[0]
+            if self.batcher is not None:
+                preds = self.batcher.submit(img).result()
+            else:
+                preds = self._forward(img)[0]
 
             output = dict(zip(xrv.datasets.default_pathologies, preds.numpy()))
             metadata = {
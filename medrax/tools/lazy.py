@@ -0,0 +1,59 @@
+import asyncio
+import threading
+from typing import Any, Callable, Optional
+
+from langchain_core.tools import BaseTool
+
+
+def _class_default(tool_cls: Optional[type], field: str) -> Any:
+    """Return a tool class's declared default for `field`, if any.
+
+    Handles both BaseTool (pydantic field) and plain-class tools (class attribute).
+    """
+    if tool_cls is None:
+        return None
+    fields = getattr(tool_cls, "model_fields", None) or getattr(tool_cls, "__fields__", None) or {}
+    info = fields.get(field)
+    if info is not None:
+        return getattr(info, "default", None)
+    return getattr(tool_cls, field, None)
+
+
+class LazyTool(BaseTool):
+    """Stand-in that builds the wrapped tool on its first call.
+
+    The tool's name, description and args schema are read from the tool class
+    defaults, so the agent can advertise it without loading its model weights.
+    Pass a ``functools.partial(ToolClass, ...)`` as the factory, or give the
+    class explicitly via ``tool_cls``.
+    """
+
+    name: str = "lazy_tool"
+    description: str = ""
+    factory: Any = None
+    tool: Optional[BaseTool] = None
+    lock: Any = None
+
+    def __init__(self, factory: Callable[[], BaseTool], tool_cls: Optional[type] = None, **kwargs: Any):
+        tool_cls = tool_cls or getattr(factory, "func", None)
+        for field in ("name", "description", "args_schema", "return_direct"):
+            if field not in kwargs:
+                default = _class_default(tool_cls, field)
+                if default is not None:
+                    kwargs[field] = default
+        super().__init__(factory=factory, lock=threading.Lock(), **kwargs)
+
+    def get_tool(self) -> BaseTool:
+        """Build the wrapped tool once (thread-safe) and return it."""
+        if self.tool is None:
+            with self.lock:
+                if self.tool is None:
+                    self.tool = self.factory()
+        return self.tool
+
+    def _run(self, *args: Any, run_manager: Any = None, **kwargs: Any) -> Any:
+        return self.get_tool()._run(*args, **kwargs)
+
+    async def _arun(self, *args: Any, run_manager: Any = None, **kwargs: Any) -> Any:
+        tool = await asyncio.to_thread(self.get_tool)
+        return await tool._arun(*args, **kwargs)
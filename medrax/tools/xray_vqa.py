@@ -49,6 +49,7 @@ class XRayVQATool(BaseTool):
         device: Optional[str] = "cuda",
         dtype: torch.dtype = torch.bfloat16,
         cache_dir: Optional[str] = None,
+        load_in_8bit: bool = False,
         **kwargs: Any,
     ) -> None:
         """Initialize the XRayVQATool.
@@ -58,6 +59,7 @@ class XRayVQATool(BaseTool):
             device: Device to run model on (cuda/cpu)
             dtype: Data type for model weights
             cache_dir: Directory to cache downloaded models
+            load_in_8bit: Load int8 weights via bitsandbytes (CUDA only) for VRAM-limited hosts
             **kwargs: Additional arguments
         """
         super().__init__(**kwargs)
@@ -78,17 +80,28 @@ class XRayVQATool(BaseTool):
             trust_remote_code=True,
             cache_dir=cache_dir,
         )
+        load_kwargs: Dict[str, Any] = {}
+        if load_in_8bit and str(self.device).startswith("cuda"):
+            load_kwargs["load_in_8bit"] = True
+            load_kwargs["torch_dtype"] = self.dtype
         self.model = AutoModelForCausalLM.from_pretrained(
             model_name,
             device_map=self.device,
             trust_remote_code=True,
             cache_dir=cache_dir,
+            **load_kwargs,
         )
-        self.model = self.model.to(dtype=self.dtype)
+        if not load_kwargs:
+            # Quantized models can't be cast; everything else runs in self.dtype (bf16 by default)
+            self.model = self.model.to(dtype=self.dtype)
         self.model.eval()
 
         transformers.__version__ = original_transformers_version
 
+    def _decode(self, tokens) -> str:
+        """Decode generated token ids the same way for single and batched requests."""
+        return self.tokenizer.decode(tokens, skip_special_tokens=True).strip()
+
     def _generate_response(self, image_paths: List[str], prompt: str, max_new_tokens: int) -> str:
         """Generate response using CheXagent model.
 
@@ -121,9 +134,57 @@ class XRayVQATool(BaseTool):
                 use_cache=True,
                 max_new_tokens=max_new_tokens,
             )[0]
-            response = self.tokenizer.decode(output[input_ids.size(1) : -1])
+            return self._decode(output[input_ids.size(1) :])
+
+    def _generate_responses(
+        self, requests: List[Tuple[List[str], str]], max_new_tokens: int
+    ) -> List[str]:
+        """Generate responses for several (image_paths, prompt) requests in one batched call.
+
+        Prompts are left-padded to a common length so a single `generate` call decodes
+        the whole batch.
+
+        Args:
+            requests: (image_paths, prompt) pairs
+            max_new_tokens: Maximum number of tokens to generate per request
+        Returns:
+            List[str]: One response per request, in order
+        """
+        encoded = []
+        for image_paths, prompt in requests:
+            query = self.tokenizer.from_list_format(
+                [*[{"image": path} for path in image_paths], {"text": prompt}]
+            )
+            conv = [
+                {"from": "system", "value": "You are a helpful assistant."},
+                {"from": "human", "value": query},
+            ]
+            encoded.append(self.tokenizer.apply_chat_template(conv, add_generation_prompt=True))
+
+        pad_id = self.tokenizer.pad_token_id
+        if pad_id is None:
+            pad_id = self.tokenizer.eos_token_id
+        width = max(len(ids) for ids in encoded)
+        input_ids = torch.tensor(
+            [[pad_id] * (width - len(ids)) + list(ids) for ids in encoded], device=self.device
+        )
+        attention_mask = torch.tensor(
+            [[0] * (width - len(ids)) + [1] * len(ids) for ids in encoded], device=self.device
+        )
 
-            return response
+        with torch.inference_mode():
+            output = self.model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                pad_token_id=pad_id,
+                do_sample=False,
+                num_beams=1,
+                temperature=1.0,
+                top_p=1.0,
+                use_cache=True,
+                max_new_tokens=max_new_tokens,
+            )
+        return [self._decode(row[width:]) for row in output]
 
     def _run(
         self,
@@ -7,24 +7,33 @@ This keeps a single global Motor client and exposes:
  - connect_to_mongo(): initialize client/db from env
  - close_mongo_connection(): close the client on shutdown
  - get_db(): retrieve active DB handle (raises if not connected)
+ - transaction(): multi-document transaction session (None on standalone servers)
  - ensure_indexes(): create minimal indexes for Admin MVP
 
 Safe-by-default: if MONGODB_URI is missing, connect_to_mongo will raise.
 Callers should catch and log to avoid crashing unrelated features.
 """
 
+from contextlib import asynccontextmanager
 from os import getenv
-from typing import Optional
+from typing import AsyncIterator, Optional
 from dotenv import load_dotenv
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorClientSession, AsyncIOMotorDatabase
 
 load_dotenv()
 
 _MONGO_URI = getenv("MONGODB_URI")
 _DB_NAME = getenv("MONGODB_DB", "medivision")
+# Case-insensitive collation for the admin search boxes; queries must pass the same
+# collation to use the *_search indexes below
+SEARCH_COLLATION = {"locale": "en", "strength": 2}
+# One client (and connection pool) is shared by every request in the process
+_MAX_POOL_SIZE = int(getenv("MONGODB_MAX_POOL_SIZE", "100"))
 
 client: Optional[AsyncIOMotorClient] = None
 db: Optional[AsyncIOMotorDatabase] = None
+# Whether the server is a replica set / mongos; resolved on first transaction()
+_supports_transactions: Optional[bool] = None
 
 
 async def connect_to_mongo():
@@ -40,17 +49,18 @@ async def connect_to_mongo():
     if not _MONGO_URI:
         raise RuntimeError("MONGODB_URI not set. Add it to your .env or environment.")
 
-    client = AsyncIOMotorClient(_MONGO_URI)
+    client = AsyncIOMotorClient(_MONGO_URI, maxPoolSize=_MAX_POOL_SIZE)
     db = client[_DB_NAME]
 
 
 async def close_mongo_connection():
     """Close the global Mongo client (noop if not connected)."""
-    global client, db
+    global client, db, _supports_transactions
     if client is not None:
         client.close()
     client = None
     db = None
+    _supports_transactions = None
 
 
 def get_db() -> AsyncIOMotorDatabase:
@@ -60,6 +70,34 @@ def get_db() -> AsyncIOMotorDatabase:
     return db
 
 
+async def _transactions_supported() -> bool:
+    global _supports_transactions
+    if _supports_transactions is None:
+        try:
+            hello = await client.admin.command("hello")
+            _supports_transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _supports_transactions = False
+    return _supports_transactions
+
+
+@asynccontextmanager
+async def transaction() -> AsyncIterator[Optional[AsyncIOMotorClientSession]]:
+    """Yield a session with an open transaction, committed on clean exit.
+
+    Standalone servers (typical local dev) cannot run transactions; there this
+    yields None so callers pass ``session=None`` and the writes run unwrapped.
+    """
+    if client is None:
+        raise RuntimeError("DB not initialized. Call connect_to_mongo() on startup.")
+    if not await _transactions_supported():
+        yield None
+        return
+    async with await client.start_session() as session:
+        async with session.start_transaction():
+            yield session
+
+
 async def ensure_indexes():
     """Create minimal indexes used by the Admin MVP.
 
@@ -68,8 +106,26 @@ async def ensure_indexes():
     database = get_db()
     # Unique, human-readable case identifier
     await database["cases"].create_index("caseId", unique=True)
+    # list_cases filters by status / assigned doctor and sorts newest first; the
+    # status prefix also serves the dashboard stats $group
+    await database["cases"].create_index([("status", 1), ("updatedAt", -1)])
+    await database["cases"].create_index([("assignedDoctorId", 1), ("updatedAt", -1)])
+    await database["cases"].create_index([("updatedAt", -1)])
     # Users unique by email (covers admins/doctors/lab techs if stored together)
     await database["users"].create_index([("email", 1)], unique=True)
     # Separate collections for convenience
     await database["doctors"].create_index([("email", 1)], unique=True)
     await database["labtechs"].create_index([("email", 1)], unique=True)
+    # create_case upserts patients by email, or by name+dob when no email is given
+    await database["patients"].create_index([("email", 1)])
+    await database["patients"].create_index([("name", 1), ("dob", 1)])
+    # Case-insensitive prefix search in the admin search boxes (one index per searched field)
+    search_fields = {
+        "cases": ("patient.name", "patient.email", "patient.phone"),
+        "patients": ("name", "email", "phone"),
+    }
+    for coll, fields in search_fields.items():
+        for field in fields:
+            await database[coll].create_index(
+                [(field, 1)], name=f"{field.replace('.', '_')}_search", collation=SEARCH_COLLATION
+            )
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+"""
+Exact-match cache for deterministic LLM calls.
+
+Usage:
+    key = make_key(model, messages, options)
+    text = get(key)
+    if text is None:
+        text = ...  # call the model
+        put(key, text)
+
+Only cache calls that are deterministic (temperature == 0); the key is a
+128-bit BLAKE2b digest of the canonical JSON of (model, messages, options).
+
+Configured via environment variables (use .env in dev):
+ - LLM_CACHE_SIZE (default 2048): in-process LRU entries
+ - LLM_CACHE_REDIS_URL (optional): shared Redis backend, e.g. redis://localhost:6379/0
+ - LLM_CACHE_TTL (default 86400): Redis entry lifetime in seconds
+
+If Redis is not installed or unreachable the in-process LRU is used alone.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+_MAX_ENTRIES = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+_REDIS_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+_KEY_PREFIX = "medrax:llm:"
+
+_lru: "OrderedDict[str, str]" = OrderedDict()
+_lock = threading.Lock()
+_redis: Any = None
+_redis_checked = False
+
+
+def _redis_client():
+    global _redis, _redis_checked
+    if _redis_checked:
+        return _redis
+    _redis_checked = True
+    url = os.getenv("LLM_CACHE_REDIS_URL")
+    if url:
+        try:
+            import redis  # type: ignore
+
+            _redis = redis.Redis.from_url(url)
+        except Exception as e:
+            print(f"[LLM_CACHE] Redis disabled: {e}")
+    return _redis
+
+
+def make_key(model: str, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": messages, "opts": options},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    with _lock:
+        value = _lru.get(key)
+        if value is not None:
+            _lru.move_to_end(key)
+            return value
+    r = _redis_client()
+    if r is None:
+        return None
+    try:
+        raw = r.get(_KEY_PREFIX + key)
+    except Exception:
+        return None
+    if raw is None:
+        return None
+    value = raw.decode("utf-8")
+    _remember(key, value)
+    return value
+
+
+def put(key: str, value: str) -> None:
+    _remember(key, value)
+    r = _redis_client()
+    if r is not None:
+        try:
+            r.setex(_KEY_PREFIX + key, _REDIS_TTL, value)
+        except Exception:
+            pass
+
+
+def _remember(key: str, value: str) -> None:
+    with _lock:
+        _lru[key] = value
+        _lru.move_to_end(key)
+        while len(_lru) > _MAX_ENTRIES:
+            _lru.popitem(last=False)
+
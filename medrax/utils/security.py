@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+"""
+Password hashing helpers.
+
+New hashes are bcrypt and stored alongside ``passwordHashAlgo: "bcrypt"``.
+Users without that field still carry the legacy unsalted SHA-256 hex digest;
+those verify via the legacy path and are re-hashed on their next login.
+
+bcrypt is deliberately slow (tens of ms per call), so request handlers should
+use the async variants, which run the work on a thread instead of the event loop.
+"""
+
+import asyncio
+import hashlib
+import hmac
+from typing import Any, Dict, Mapping
+
+import bcrypt
+
+PASSWORD_HASH_ALGO = "bcrypt"
+_BCRYPT_ROUNDS = 12
+
+
+def _encode(pw: str) -> bytes:
+    # bcrypt only uses the first 72 bytes; newer releases raise instead of truncating
+    return pw.encode("utf-8")[:72]
+
+
+def hash_password(pw: str) -> str:
+    return bcrypt.hashpw(_encode(pw), bcrypt.gensalt(_BCRYPT_ROUNDS)).decode("ascii")
+
+
+def password_fields(pw: str) -> Dict[str, Any]:
+    """Return the user-document fields that store a freshly hashed password."""
+    return {"passwordHash": hash_password(pw), "passwordHashAlgo": PASSWORD_HASH_ALGO}
+
+
+def verify_password(pw: str, user: Mapping[str, Any]) -> bool:
+    stored = user.get("passwordHash")
+    if not stored:
+        return False
+    if user.get("passwordHashAlgo") == PASSWORD_HASH_ALGO:
+        try:
+            return bcrypt.checkpw(_encode(pw), stored.encode("ascii"))
+        except ValueError:
+            return False
+    legacy = hashlib.sha256(pw.encode()).hexdigest()
+    return hmac.compare_digest(legacy, stored)
+
+
+def needs_rehash(user: Mapping[str, Any]) -> bool:
+    return user.get("passwordHashAlgo") != PASSWORD_HASH_ALGO
+
+
+async def password_fields_async(pw: str) -> Dict[str, Any]:
+    return await asyncio.to_thread(password_fields, pw)
+
+
+async def verify_password_async(pw: str, user: Mapping[str, Any]) -> bool:
+    return await asyncio.to_thread(verify_password, pw, user)
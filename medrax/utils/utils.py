@@ -1,5 +1,6 @@
 import os
 import json
+from functools import lru_cache
 from typing import Dict, List
 
 
@@ -19,6 +20,12 @@ def load_prompts_from_file(file_path: str) -> Dict[str, str]:
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Prompts file not found: {file_path}")
 
+    # Parsed once per (path, mtime); callers get their own copy to mutate
+    return dict(_parse_prompts_file(file_path, os.path.getmtime(file_path)))
+
+
+@lru_cache(maxsize=8)
+def _parse_prompts_file(file_path: str, mtime: float) -> Dict[str, str]:
     prompts = {}
     current_prompt = None
     current_content = []
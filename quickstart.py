@@ -1,18 +1,23 @@
 import json
-import ollama
 import os
 import time
 import logging
 import base64
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from tenacity import retry, wait_exponential, stop_after_attempt
 from datasets import load_dataset
 
+from benchmark.llm import get_client
+from medrax.utils import llm_cache
+
 # Initialize global variables
 logger = logging.getLogger('benchmark')
 model_name = 'mistral:latest'  # default value
 temperature = 0.2  # default value
+keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # keep the model resident between requests
 log_filename = None
 
 def setup_logging(filename):
@@ -125,24 +130,36 @@ Base your answer only on the provided images and case information."""
     try:
         start_time = time.time()
 
-        response = client.chat(
-            model=model_name,
-            messages=[
-                {
-                    "role": "system", 
-                    "content": "You are a medical imaging expert. Provide only the letter corresponding to your answer choice (A/B/C/D/E/F)."
-                },
-                {
-                    "role": "user",
-                    "content": prompt,
-                    "images": images
-                }
-            ],
-            options={
-                "temperature": temperature,
-                "num_predict": 50,
+        messages = [
+            {
+                "role": "system", 
+                "content": "You are a medical imaging expert. Provide only the letter corresponding to your answer choice (A/B/C/D/E/F)."
+            },
+            {
+                "role": "user",
+                "content": prompt,
+                "images": images
             }
-        )
+        ]
+        options = {
+            "temperature": temperature,
+            "num_predict": 50,
+        }
+        # Deterministic runs (--temperature 0) answer replayed questions from the exact-match
+        # cache; set LLM_CACHE_REDIS_URL to share it across runs
+        cache_key = llm_cache.make_key(model_name, messages, options) if temperature == 0 else None
+        cached = llm_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            response = {"message": {"content": cached}}
+        else:
+            response = client.chat(
+                model=model_name,
+                messages=messages,
+                options=options,
+                keep_alive=keep_alive,
+            )
+            if cache_key is not None:
+                llm_cache.put(cache_key, response['message']['content'])
         duration = time.time() - start_time
 
         log_entry = {
@@ -151,6 +168,7 @@ Base your answer only on the provided images and case information."""
             "model": model_name,
             "temperature": temperature,
             "duration": round(duration, 2),
+            "cached": cached is not None,
             "model_answer": response['message']['content'],
             "correct_answer": example['answer'],
             "input": {
@@ -194,6 +212,7 @@ def main():
     parser.add_argument('--temperature', type=float, default=0.2, help='Temperature for model inference')
     parser.add_argument('--log-prefix', type=str, help='Prefix for log filename (default: model name)')
     parser.add_argument('--max-cases', type=int, default=None, help='Maximum number of cases to process (default: all)')
+    parser.add_argument('--workers', type=int, default=1, help='Concurrent Ollama requests (default: 1)')
     args = parser.parse_args()
     
     # Set global variables
@@ -223,7 +242,14 @@ def main():
 
     # Initialize the Ollama Client
     ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    client = ollama.Client(host=ollama_base_url)
+    client = get_client(ollama_base_url, max_connections=max(16, args.workers))
+    # Open a pooled connection and load the model before the timed requests start;
+    # best-effort, so an unreachable server or unpulled model still fails per question
+    try:
+        client.list()
+        client.generate(model=model_name, prompt="", keep_alive=keep_alive)
+    except Exception as e:
+        print(f"Warning: could not prewarm {model_name} at {ollama_base_url}: {e}")
 
     total_examples = len(train_dataset)
     processed = 0
@@ -241,24 +267,38 @@ def main():
         total_examples = len(dataset_to_process)
         print(f"Processing {total_examples} cases (limited by --max-cases argument)")
 
-    for example in dataset_to_process:
-        if shutdown_event.is_set():
-            print("\nGraceful shutdown initiated. Saving progress...")
-            break
-            
-        processed += 1
-        
-        response = create_multimodal_request(example, client, args.use_urls, shutdown_event)
-
+    def report(example, response, done):
         if response is None:
-            skipped += 1
             print(f"Skipped question: {example.get('question_id', 'unknown')}")
-            continue
-
-        print(f"Progress: {processed}/{total_examples}")
+            return 1
+        print(f"Progress: {done}/{total_examples}")
         print(f"Question ID: {example.get('question_id', 'unknown')}")
         print(f"Model Answer: {response['message']['content']}")
         print(f"Correct Answer: {example['answer']}\n")
+        return 0
+
+    # Keep up to --workers requests in flight; results are reported in dataset order
+    workers = max(1, args.workers)
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for example in dataset_to_process:
+            if shutdown_event.is_set():
+                print("\nGraceful shutdown initiated. Saving progress...")
+                break
+
+            processed += 1
+            pending.append((example, pool.submit(create_multimodal_request, example, client, args.use_urls, shutdown_event)))
+
+            if len(pending) >= workers:
+                example, future = pending.popleft()
+                done += 1
+                skipped += report(example, future.result(), done)
+
+        while pending:
+            example, future = pending.popleft()
+            done += 1
+            skipped += report(example, future.result(), done)
 
     print(f"\nBenchmark Summary:")
     print(f"Total Examples Processed: {processed}")